@@ -16,35 +16,64 @@
 # under the License.
 
 import ctypes
+import time
 
-from multiprocessing import Value
+from multiprocessing import RawArray
 from datetime import datetime, timezone
 
 from perf_tests.attestation_task import AttestationTask
 
 
+# The state of every agent is held in a few arrays in shared memory, instead of separate synchronised values for each
+# agent, so that even a very large number of agents can be simulated without exhausting memory or file descriptors.
+# No locks are needed as an agent's state is only ever changed by the worker process which holds the agent's lease
+class AgentStateTable:
+    def __init__(self, agent_count):
+        self._busy = RawArray(ctypes.c_bool, agent_count)
+        self._task_counts = RawArray(ctypes.c_int, agent_count)
+        self._release_times = RawArray(ctypes.c_double, agent_count)
+
+    @property
+    def busy(self):
+        return self._busy
+
+    @property
+    def task_counts(self):
+        return self._task_counts
+
+    @property
+    def release_times(self):
+        return self._release_times
+
+    @property
+    def agent_count(self):
+        return len(self._busy)
+
+    @property
+    def size(self):
+        return ctypes.sizeof(self._busy) + ctypes.sizeof(self._task_counts) + ctypes.sizeof(self._release_times)
+
+
+# Agents are lightweight views onto an AgentStateTable and can be created cheaply whenever they are needed
 class Agent:
     def __init__(self, task_manager, index):
         self._task_manager = task_manager
         self._index = index
-        self._busy = Value(ctypes.c_bool, False)
-        self._task_count = Value(ctypes.c_int, 0)
-
-    def _increment_task_count(self):
-        with self._task_count.get_lock():
-            self._task_count.value += 1
+        self._states = task_manager.agent_states
 
     def new_task(self, worker_index, evidence):
         if self.busy or self.finished:
             return None
 
         task = AttestationTask(worker_index, self, evidence)
-        self._busy.value = True
-        self._increment_task_count()
+        self._states.busy[self.index] = True
+        self._states.task_counts[self.index] += 1
         return task
 
     def conclude_task(self, task):
-        self._busy.value = False
+        self._states.release_times[self.index] = time.perf_counter()
+        self._states.busy[self.index] = False
+        self.task_manager.release_agent(self)
 
     @property
     def task_manager(self):
@@ -60,7 +89,7 @@ class Agent:
 
     @property
     def busy(self):
-        return self._busy.value
+        return self._states.busy[self.index]
 
     @property
     def finished(self):
@@ -71,8 +100,22 @@ class Agent:
 
     @property
     def task_count(self):
-        return self._task_count.value
+        return self._states.task_counts[self.index]
+
+    @property
+    def attestation_count(self):
+        # Includes any past attestations stored in the database before testing began
+        return self.task_manager.execution.history_count + self.task_count
+
+    @property
+    def idle_time(self):
+        release_time = self._states.release_times[self.index]
+
+        if not release_time:
+            return None
+
+        return time.perf_counter() - release_time
 
     @property
     def boot_time(self):
-        return datetime.fromtimestamp(self._task_count.value, tz=timezone.utc).isoformat()
+        return datetime.fromtimestamp(self.attestation_count, tz=timezone.utc).isoformat()
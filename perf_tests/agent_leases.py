@@ -0,0 +1,82 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+
+from multiprocessing import Lock, RawArray, RawValue
+
+
+# Idle agents are kept in a ring buffer in shared memory, in the order in which they were released, so that acquiring an
+# agent takes the one which has been idle the longest. Acquiring and releasing agents are constant-time operations which
+# hold a single lock shared by all worker processes, no matter how many agents there are
+class AgentLeaseTable:
+    def __init__(self, agent_count):
+        self._lock = Lock()
+        self._idle_agents = RawArray(ctypes.c_int, agent_count)
+        self._idle_agents[:] = range(agent_count)
+        self._head = RawValue(ctypes.c_int, 0)
+        self._idle_count = RawValue(ctypes.c_int, agent_count)
+        self._busy_count = RawValue(ctypes.c_int, 0)
+        self._retired_count = RawValue(ctypes.c_int, 0)
+
+    def acquire(self):
+        with self._lock:
+            if not self._idle_count.value:
+                return None
+
+            agent_index = self._idle_agents[self._head.value]
+            self._head.value = (self._head.value + 1) % self.agent_count
+            self._idle_count.value -= 1
+            self._busy_count.value += 1
+
+        return agent_index
+
+    def release(self, agent_index, requeue=True):
+        with self._lock:
+            self._busy_count.value -= 1
+
+            if not requeue:
+                return
+
+            tail = (self._head.value + self._idle_count.value) % self.agent_count
+            self._idle_agents[tail] = agent_index
+            self._idle_count.value += 1
+
+    def retire(self, agent_index):
+        # Marks an agent as having started its last task, after which it should be released without being requeued
+        with self._lock:
+            self._retired_count.value += 1
+
+    @property
+    def agent_count(self):
+        return len(self._idle_agents)
+
+    @property
+    def size(self):
+        return ctypes.sizeof(self._idle_agents) + ctypes.sizeof(ctypes.c_int) * 4
+
+    @property
+    def idle_count(self):
+        return self._idle_count.value
+
+    @property
+    def busy_count(self):
+        return self._busy_count.value
+
+    @property
+    def retired_count(self):
+        return self._retired_count.value
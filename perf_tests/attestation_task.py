@@ -16,6 +16,7 @@
 # under the License.
 
 import asyncio
+import time
 
 from perf_tests.request_attempt import RequestAttempt, DeserializedAttempt
 
@@ -25,8 +26,14 @@ class AttestationTask:
         self._worker_index = worker_index
         self._agent = agent
         self._index = agent.task_count
-        self._evidence = evidence.copy()
-
+        # Differs from the task index when past attestations were stored in the database before testing began
+        self._attestation_index = agent.attestation_count
+        self._evidence = evidence
+
+        self._scheduled_time = None
+        self._idle_time = agent.idle_time
+        self._deadline = None
+        self._deadline_exceeded = False
         self._asyncio_task = None
         self._create_attempts = []
         self._update_attempts = []
@@ -34,64 +41,83 @@ class AttestationTask:
     async def _new_create_attempt(self):
         url = f"{self.task_manager.execution.verifier_url}/v3.0/agents/{self.agent.id}/attestations"
         req_attempt = RequestAttempt(self, "POST", url)
-        req_attempt.set_body({
-            "evidence_supported": [ item.render_supported() for item in self.evidence ],
-            "system_info": {
-                "boot_time": self.agent.boot_time
-            }
-        })
+        req_attempt.set_body(self.evidence.create_body(self.agent.boot_time))
         self._create_attempts.append(req_attempt)
         return await req_attempt.perform()
 
     async def _new_update_attempt(self):
-        url = f"{self.task_manager.execution.verifier_url}/v3.0/agents/{self.agent.id}/attestations/{self.index}"
-        req_attempt = RequestAttempt(self, "PATCH", url)
-        req_attempt.set_body({
-            "evidence_collected": [ item.render_collected() for item in self.evidence ]
-        })
+        agent_url = f"{self.task_manager.execution.verifier_url}/v3.0/agents/{self.agent.id}"
+        req_attempt = RequestAttempt(self, "PATCH", f"{agent_url}/attestations/{self.attestation_index}")
+        req_attempt.set_body(self.evidence.update_body)
         self._update_attempts.append(req_attempt)
         return await req_attempt.perform()
 
-    async def execute(self):
-        while True:
-            create_attempt = await self._new_create_attempt()
+    def _misses_deadline(self, wait=0.0):
+        # Returns whether a request sent after waiting for the given time could not finish before the deadline, as less
+        # time would be left than its shortest timeout, and if so, records that the attestation missed its deadline
+        if self.remaining_time is None or self.remaining_time - wait >= RequestAttempt.MIN_TIMEOUT:
+            return False
+
+        self._deadline_exceeded = True
+        return True
 
-            if create_attempt.retry_after:
-                await asyncio.sleep(create_attempt.retry_after)
-                continue
+    async def _perform_with_retries(self, new_attempt):
+        # Repeats a request for as long as the verifier asks for it to be retried and the retry policy allows
+        retry_policy = self.task_manager.retry_policy
+        attempt_count = 0
 
-            if not create_attempt.ok:
+        while True:
+            if self._misses_deadline():
                 return False
 
-            break
+            req_attempt = await new_attempt()
+            retry_policy.record_attempt(self.worker_index, attempt_count > 0)
+            attempt_count += 1
 
-        while True:
-            update_attempt = await self._new_update_attempt()
+            if not req_attempt.retry_after:
+                # A request which failed with no time left was cut short by the deadline
+                if not req_attempt.ok:
+                    self._misses_deadline()
 
-            if update_attempt.retry_after:
-                await asyncio.sleep(update_attempt.retry_after)
-                continue
+                return bool(req_attempt.ok)
 
-            if not update_attempt.ok:
+            if not retry_policy.allow_retry(attempt_count):
                 return False
 
-            break
+            delay = retry_policy.get_delay(req_attempt.retry_after, attempt_count - 1)
 
-        return True
+            # Give up straight away rather than wait past the deadline
+            if self._misses_deadline(delay):
+                return False
+
+            await asyncio.sleep(delay)
+
+    async def execute(self):
+        deadline = self.task_manager.execution.deadline
+
+        if deadline:
+            self._deadline = time.perf_counter() + deadline
+
+        if not await self._perform_with_retries(self._new_create_attempt):
+            return False
+
+        return await self._perform_with_retries(self._new_update_attempt)
 
     async def result(self):
         await self._asyncio_task
 
-    def start_async(self):
+    def start_async(self, scheduled_time=None):
         # self.task_manager.stats.start_tracking()
+        self._scheduled_time = scheduled_time
         self._asyncio_task = asyncio.create_task(self.execute())
         self._asyncio_task.add_done_callback(self.conclude)
         return self._asyncio_task
 
     def conclude(self, *args):
         # print(f"Task {self.index} for {self.agent.id} finished")
-        self.task_manager.conclude_task(self)
+        # Release the agent before notifying the task manager so that the scheduler can immediately reuse it
         self.agent.conclude_task(self)
+        self.task_manager.conclude_task(self)
 
     def render(self):
         return {
@@ -102,6 +128,9 @@ class AttestationTask:
             "update_successful": self.update_successful,
             "create_duration": self.create_duration,
             "update_duration": self.update_duration,
+            "scheduled_time": self.scheduled_time,
+            "idle_time": self.idle_time,
+            "deadline_exceeded": self.deadline_exceeded,
             "create_attempts": [ create_attempt.render() for create_attempt in self.create_attempts ],
             "update_attempts": [ update_attempt.render() for update_attempt in self.update_attempts ]
         }
@@ -122,6 +151,10 @@ class AttestationTask:
     def index(self):
         return self._index
 
+    @property
+    def attestation_index(self):
+        return self._attestation_index
+
     @property
     def evidence(self):
         return self._evidence
@@ -180,6 +213,38 @@ class AttestationTask:
     def total_duration(self):
         return self.create_duration + self.update_duration
 
+    @property
+    def scheduled_time(self):
+        return self._scheduled_time
+
+    @property
+    def idle_time(self):
+        return self._idle_time
+
+    @property
+    def deadline(self):
+        return self._deadline
+
+    @property
+    def remaining_time(self):
+        # Time left until the deadline of the attestation, or None if it has no deadline
+        if self.deadline is None:
+            return None
+
+        return self.deadline - time.perf_counter()
+
+    @property
+    def deadline_exceeded(self):
+        # Whether the attestation was given up on as its deadline was reached
+        return self._deadline_exceeded
+
+    @property
+    def scheduled_latency(self):
+        if self.scheduled_time is None or not self.end_time:
+            return None
+
+        return self.end_time - self.scheduled_time
+
     @property
     def start_time(self):
         if not self.create_attempts:
@@ -204,8 +269,12 @@ class DeserializedTask(AttestationTask):
         self._agent = None
         self._agent_index = data.get("agent_index")
         self._index = data.get("task_index")
-        self._evidence = []
+        self._evidence = None
 
+        self._scheduled_time = data.get("scheduled_time")
+        self._idle_time = data.get("idle_time")
+        self._deadline = None
+        self._deadline_exceeded = bool(data.get("deadline_exceeded"))
         self._asyncio_task = None
         self._create_attempts = [DeserializedAttempt(self, create_data) for create_data in data["create_attempts"]]
         self._update_attempts = [DeserializedAttempt(self, update_data) for update_data in data["update_attempts"]]
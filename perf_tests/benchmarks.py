@@ -0,0 +1,449 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+import json
+import os
+import resource
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from multiprocessing import Array, Barrier, Process, RawValue, Value
+
+from perf_tests.agent import AgentStateTable
+from perf_tests.agent_leases import AgentLeaseTable
+from perf_tests.mock_evidence import MockTPMQuote, MockUEFILog, MockIMALog, EvidencePayloads
+from perf_tests.request_attempt import RequestAttempt
+from perf_tests.result_aggregator import ResultAggregator
+from perf_tests.result_serializer import ResultSerializer
+from perf_tests.stats import GlobalStats, Histogram, RequestStats
+from perf_tests.output import OutputHelpers, Table
+
+
+class Benchmarks:
+    @staticmethod
+    def run_in_processes(target, process_count, *args):
+        # Starts the given number of processes and returns how long they took to run the target function, excluding the
+        # time taken to start the processes
+        start_time = RawValue(ctypes.c_double, 0.0)
+
+        def set_start_time():
+            # Runs in whichever process reaches the barrier last, before any of them are released, so that the start
+            # time is accurate even when there are more processes than CPUs
+            start_time.value = time.perf_counter()
+
+        barrier = Barrier(process_count + 1, action=set_start_time)
+        processes = [Process(target=target, args=(barrier, i, *args)) for i in range(process_count)]
+
+        for process in processes:
+            process.start()
+
+        barrier.wait()
+
+        for process in processes:
+            process.join()
+
+        return time.perf_counter() - start_time.value
+
+    @staticmethod
+    def _cycle_leases(barrier, _process_index, leases, lease_count):
+        barrier.wait()
+
+        for _ in range(lease_count):
+            agent_index = leases.acquire()
+            leases.release(agent_index)
+
+    @classmethod
+    def agent_leases(cls, agent_counts, lease_count, process_count):
+        process_count_f = OutputHelpers.format_count(process_count, "process", "processes")
+        print(f"\nAcquiring and releasing {lease_count} agent leases using {process_count_f}...\n")
+
+        table = (
+            Table("<10", ">10", ">12", ">12")
+            .head("agents", "setup", "per lease", "leases/s")
+        )
+
+        for agent_count in agent_counts:
+            start_time = time.perf_counter()
+            leases = AgentLeaseTable(agent_count)
+            setup_time = time.perf_counter() - start_time
+
+            # Keep half the agents busy so that the queue of idle agents wraps around the ring buffer
+            for _ in range(agent_count // 2):
+                leases.acquire()
+
+            duration = cls.run_in_processes(cls._cycle_leases, process_count, leases, lease_count // process_count)
+
+            table.row(
+                agent_count,
+                OutputHelpers.format_duration(setup_time),
+                OutputHelpers.format_duration(duration / lease_count),
+                int(lease_count / duration)
+            )
+
+        table.print()
+        print("")
+
+    @staticmethod
+    def _allocate_agent_state(agent_count, legacy):
+        # Runs in a fresh process so that the growth in its peak memory usage can be attributed to the agents alone
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        start_time = time.perf_counter()
+
+        if legacy:
+            # Emulate the previous approach of allocating separate synchronised values for each agent
+            values = [(Value(ctypes.c_bool, False), Value(ctypes.c_int, 0)) for _ in range(agent_count)]
+            shared_size = None
+        else:
+            states = AgentStateTable(agent_count)
+            leases = AgentLeaseTable(agent_count)
+            shared_size = states.size + leases.size
+
+        setup_time = time.perf_counter() - start_time
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - start_rss
+
+        return setup_time, shared_size, rss
+
+    @classmethod
+    def agent_state(cls, agent_counts, legacy_agent_count):
+        print("\nAllocating shared state for mock agents, with figures given per 100k agents...\n")
+
+        table = (
+            Table("<10", "<8", ">10", ">12", ">12")
+            .head("agents", "storage", "setup", "shared mem", "peak rss")
+        )
+
+        runs = [(agent_count, False) for agent_count in agent_counts]
+
+        if legacy_agent_count:
+            runs.append((legacy_agent_count, True))
+
+        for agent_count, legacy in runs:
+            with ProcessPoolExecutor(1) as executor:
+                setup_time, shared_size, rss = executor.submit(cls._allocate_agent_state, agent_count, legacy).result()
+
+            scale = 100000 / agent_count
+
+            table.row(
+                agent_count,
+                "values" if legacy else "arrays",
+                OutputHelpers.format_duration(setup_time * scale),
+                OutputHelpers.format_size(int(shared_size * scale)) if shared_size else "--",
+                OutputHelpers.format_size(int(rss * scale))
+            )
+
+        table.print()
+        print("")
+
+    @staticmethod
+    def _render_bodies(evidence, iterations):
+        # Renders and serialises each request body from scratch, as was done before EvidencePayloads was introduced
+        for i in range(iterations):
+            create_attempt = RequestAttempt(None, "POST", "")
+            create_attempt.set_body({
+                "evidence_supported": [ item.render_supported() for item in evidence ],
+                "system_info": {
+                    "boot_time": str(i)
+                }
+            })
+
+            update_attempt = RequestAttempt(None, "PATCH", "")
+            update_attempt.set_body({
+                "evidence_collected": [ item.render_collected() for item in evidence ]
+            })
+
+    @staticmethod
+    def _reuse_bodies(payloads, iterations):
+        for i in range(iterations):
+            create_attempt = RequestAttempt(None, "POST", "")
+            create_attempt.set_body(payloads.create_body(str(i)))
+
+            update_attempt = RequestAttempt(None, "PATCH", "")
+            update_attempt.set_body(payloads.update_body)
+
+    @classmethod
+    def payloads(cls, iterations):
+        print(f"\nPreparing create and update request bodies for {iterations} attestations...\n")
+
+        evidence = [MockTPMQuote(), MockUEFILog(), MockIMALog()]
+
+        start_time = time.process_time()
+        payloads = EvidencePayloads(evidence)
+        setup_time = time.process_time() - start_time
+
+        table = (
+            Table("<24", ">16", ">16")
+            .head("", "cpu/attestation", "attestations/s")
+        )
+
+        runs = [
+            ("Rendered per request", cls._render_bodies, evidence),
+            ("Pre-serialised", cls._reuse_bodies, payloads)
+        ]
+
+        for label, target, arg in runs:
+            start_time = time.process_time()
+            target(arg, iterations)
+            cpu_time = time.process_time() - start_time
+
+            table.row(label, OutputHelpers.format_duration(cpu_time / iterations), int(iterations / cpu_time))
+
+        table.print()
+        print(f"\nSerialising the bodies once per worker took {OutputHelpers.format_duration(setup_time)} of CPU time\n")
+
+    @staticmethod
+    def _record_durations(barrier, process_index, stats, record_count):
+        GlobalStats.use_shard(process_index)
+        barrier.wait()
+
+        for i in range(record_count):
+            stats.ok.record((i % 1000) / 1000)
+
+    @staticmethod
+    def _record_durations_locked(barrier, _process_index, counters, record_count):
+        # Emulates the previous approach of updating synchronised values shared by all processes, with each duration
+        # recorded against both the counter and the total counter above it
+        barrier.wait()
+
+        for i in range(record_count):
+            duration = (i % 1000) / 1000
+            index = Histogram.bucket_index(int(duration * 1000000))
+
+            for count, total_duration, shortest_duration, longest_duration, histogram in counters:
+                with count.get_lock():
+                    count.value += 1
+
+                with total_duration.get_lock():
+                    total_duration.value += duration
+
+                with shortest_duration.get_lock():
+                    if duration < shortest_duration.value:
+                        shortest_duration.value = duration
+
+                with longest_duration.get_lock():
+                    if duration > longest_duration.value:
+                        longest_duration.value = duration
+
+                with histogram.get_lock():
+                    histogram.get_obj()[index] += 1
+
+    @classmethod
+    def stats_record(cls, process_counts, record_count, legacy):
+        print(f"\nRecording {record_count} request durations split across each no. of processes...\n")
+
+        table = (
+            Table("<10", "<8", ">12", ">14", ">12")
+            .head("processes", "storage", "per record", "records/s", "merge")
+        )
+
+        for process_count in process_counts:
+            runs = [False, True] if legacy else [False]
+
+            for locked in runs:
+                if locked:
+                    counters = [
+                        (
+                            Value(ctypes.c_int, 0),
+                            Value(ctypes.c_double, 0.0),
+                            Value(ctypes.c_float, 9999.0),
+                            Value(ctypes.c_float, 0.0),
+                            Array(ctypes.c_int64, Histogram.bucket_count())
+                        )
+                        for _ in range(2)
+                    ]
+
+                    target, arg = cls._record_durations_locked, counters
+                else:
+                    target, arg = cls._record_durations, RequestStats(process_count)
+
+                duration = cls.run_in_processes(target, process_count, arg, record_count // process_count)
+
+                # Reading the sharded statistics requires merging the shards, which is measured separately
+                merge_time = None
+
+                if not locked:
+                    start_time = time.perf_counter()
+                    arg.make_table("Requests")
+                    merge_time = time.perf_counter() - start_time
+
+                table.row(
+                    process_count,
+                    "locked" if locked else "sharded",
+                    OutputHelpers.format_duration(duration / record_count),
+                    int(record_count / duration),
+                    OutputHelpers.format_duration(merge_time) if merge_time is not None else "--"
+                )
+
+        table.print()
+        print("")
+
+    @staticmethod
+    def _make_sample_task():
+        # Stands in for a completed attestation task, with a rendered form of a similar size and shape
+        attempt = {
+            "action": "create", "method": "POST",
+            "url": "https://127.0.0.1:8881/v3.0/agents/perf-test-agent-1/attestations",
+            "start_time": 1000.0, "end_time": 1000.05, "duration": 0.05, "queue_time": 0.0001,
+            "timings": {
+                "namelookup": 0.0, "connect": 0.0, "appconnect": 0.0, "pretransfer": 0.0001, "starttransfer": 0.049,
+                "total": 0.05
+            },
+            "ok": True, "conflicts": False, "retry_after": None
+        }
+
+        record = {
+            "agent_index": 1, "task_index": 1, "worker_index": 0, "create_successful": True, "update_successful": True,
+            "create_duration": 0.05, "update_duration": 0.05, "scheduled_time": None, "idle_time": 0.001,
+            "create_attempts": [attempt], "update_attempts": [{**attempt, "action": "update", "method": "PATCH"}]
+        }
+
+        return SimpleNamespace(render=lambda: record)
+
+    @classmethod
+    def _write_results_direct(cls, barrier, _process_index, file_path, record_count):
+        # Emulates the previous approach, in which every worker opened the results file and appended its own tasks
+        task = cls._make_sample_task()
+        barrier.wait()
+
+        for start in range(0, record_count, ResultSerializer.BATCH_SIZE):
+            with open(file_path, "a") as f:
+                for _ in range(min(ResultSerializer.BATCH_SIZE, record_count - start)):
+                    f.write(json.dumps(task.render()) + "\n")
+
+    @classmethod
+    def _write_results_queued(cls, barrier, _process_index, serializer, record_count):
+        task = cls._make_sample_task()
+        barrier.wait()
+
+        for _ in range(record_count):
+            serializer.queue_task(task)
+
+        serializer.write_tasks()
+
+    @classmethod
+    def results_writer(cls, process_counts, record_count):
+        print(f"\nWriting {record_count} task results split across each no. of processes...\n")
+
+        table = (
+            Table("<10", "<8", ">12", ">12", ">10")
+            .head("processes", "writer", "per record", "records/s", "lines ok")
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            for process_count in process_counts:
+                for queued in [False, True]:
+                    file_path = os.path.join(directory, f"{process_count}-{queued}.jsonl")
+                    open(file_path, "w").close()
+                    per_process = record_count // process_count
+
+                    if queued:
+                        serializer = ResultSerializer(file_path)
+                        serializer.start_writer()
+                        duration = cls.run_in_processes(
+                            cls._write_results_queued, process_count, serializer, per_process
+                        )
+
+                        # Include the time taken for the writer to write out everything it has received
+                        start_time = time.perf_counter()
+                        serializer.stop_writer()
+                        duration += time.perf_counter() - start_time
+                    else:
+                        duration = cls.run_in_processes(
+                            cls._write_results_direct, process_count, file_path, per_process
+                        )
+
+                    # Check that every line was written whole, without being interleaved with another
+                    with open(file_path) as f:
+                        valid = sum(1 for line in f if line.startswith("{") and line.endswith("}\n"))
+
+                    table.row(
+                        process_count,
+                        "single" if queued else "each",
+                        OutputHelpers.format_duration(duration / (per_process * process_count)),
+                        int(per_process * process_count / duration),
+                        "yes" if valid == per_process * process_count else "no"
+                    )
+
+        table.print()
+        print("")
+
+    @classmethod
+    def _write_sample_results(cls, file_path, task_count):
+        record = cls._make_sample_task().render()
+
+        with open(file_path, "w") as f:
+            for i in range(task_count):
+                # Spread the tasks over time so that the timeline has more than one window
+                start_time = 1000.0 + i * 0.01
+
+                for attempt in record["create_attempts"] + record["update_attempts"]:
+                    attempt["start_time"] = start_time
+                    attempt["end_time"] = start_time + attempt["duration"]
+
+                f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def _aggregate_results(file_path, worker_count, in_memory):
+        # Runs in a fresh process so that the peak memory usage of each approach can be measured separately
+        start_time = time.perf_counter()
+        aggregator = ResultAggregator(ResultSerializer(file_path), 10, worker_count)
+        aggregator.aggregate(in_memory=in_memory)
+        duration = time.perf_counter() - start_time
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+        return aggregator.task_count, duration, rss, child_rss
+
+    @classmethod
+    def report_results(cls, file_path, task_count, worker_counts):
+        with tempfile.TemporaryDirectory() as directory:
+            if not file_path:
+                file_path = os.path.join(directory, "sample.jsonl")
+                cls._write_sample_results(file_path, task_count)
+
+            file_size_f = OutputHelpers.format_size(os.path.getsize(file_path))
+            print(f"\nComputing statistics from {file_size_f} of results...\n")
+
+            table = (
+                Table("<10", ">10", ">10", ">10", ">12", ">12")
+                .head("reader", "processes", "duration", "speed-up", "parent rss", "worker rss")
+            )
+
+            runs = [(1, True)] + [(worker_count, False) for worker_count in worker_counts]
+            baseline = None
+
+            for worker_count, in_memory in runs:
+                with ProcessPoolExecutor(1) as executor:
+                    future = executor.submit(cls._aggregate_results, file_path, worker_count, in_memory)
+                    _, duration, rss, child_rss = future.result()
+
+                baseline = baseline or duration
+
+                table.row(
+                    "in memory" if in_memory else "streamed",
+                    worker_count,
+                    OutputHelpers.format_duration(duration),
+                    f"{round(baseline / duration, 1)}x",
+                    OutputHelpers.format_size(rss),
+                    OutputHelpers.format_size(child_rss) if not in_memory else "--"
+                )
+
+        table.print()
+        print("")
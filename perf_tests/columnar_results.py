@@ -0,0 +1,578 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import math
+import mmap
+import struct
+import sys
+import zlib
+
+from array import array
+from pathlib import Path
+
+from perf_tests.attestation_task import DeserializedTask
+from perf_tests.request_attempt import RequestAttempt, DeserializedAttempt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Stores test results as typed columns, rather than as one JSON object per task, so that they take less space and can be
+# loaded without parsing each task. The file starts with MAGIC and the header of the original results, as JSON preceded
+# by its length, and is followed by chunks, each of which holds a number of tasks and all their request attempts. Each
+# column of a chunk is compressed separately and preceded by its length. Attempts are stored in the order of their
+# tasks, create attempts first, so a task's attempts can be found from the attempt counts alone. Missing values are
+# stored as NaN for floats and -1 for integers and booleans. The cause of each failed attempt is stored as its index in
+# RequestAttempt.FAILURE_TYPES
+class ColumnarResults:
+    MAGIC = b"KLPERF\x00\x03"
+    # Files written before the header was added
+    LEGACY_MAGIC = b"KLPERF\x00\x01"
+    # Files written before the causes of failures and missed deadlines were stored, which lack the ADDED_COLUMNS
+    UNCLASSIFIED_MAGIC = b"KLPERF\x00\x02"
+    SUFFIX = ".columns"
+    # No. of tasks per chunk
+    CHUNK_SIZE = 65536
+
+    # Column names and their array typecodes, which are also understood by NumPy
+    TASK_COLUMNS = [
+        ("agent_index", "i"),
+        ("task_index", "i"),
+        ("worker_index", "i"),
+        ("scheduled_time", "d"),
+        ("idle_time", "d"),
+        ("create_attempt_count", "i"),
+        ("update_attempt_count", "i"),
+        ("deadline_exceeded", "b")
+    ]
+
+    TIMING_NAMES = ["namelookup", "connect", "appconnect", "pretransfer", "starttransfer", "total"]
+
+    ATTEMPT_COLUMNS = [
+        ("start_time", "d"),
+        ("end_time", "d"),
+        ("duration", "d"),
+        ("queue_time", "d"),
+        *[(f"timing_{name}", "d") for name in TIMING_NAMES],
+        ("ok", "b"),
+        ("conflicts", "b"),
+        ("retry_after", "i"),
+        ("failure", "h")
+    ]
+
+    # Columns absent from files with an older magic number
+    ADDED_COLUMNS = ["deadline_exceeded", "failure"]
+
+    def __init__(self, file_path):
+        self._file_path = Path(file_path)
+        self._columns = None
+        self._task_count = 0
+        self._attempt_count = 0
+        self._header = None
+
+    @staticmethod
+    def _to_float(value):
+        return math.nan if value is None else value
+
+    @staticmethod
+    def _to_int(value):
+        return -1 if value is None else int(value)
+
+    @staticmethod
+    def _get_failure_index(attempt):
+        failure = attempt.get("failure")
+
+        # Results saved before failures were classified do not record their cause
+        if "failure" not in attempt and not attempt.get("ok") and not attempt.get("retry_after"):
+            failure = "other"
+
+        return RequestAttempt.FAILURE_TYPES.index(failure) if failure in RequestAttempt.FAILURE_TYPES else -1
+
+    @classmethod
+    def _make_chunk(cls, tasks):
+        columns = {name: array(typecode) for name, typecode in cls.TASK_COLUMNS + cls.ATTEMPT_COLUMNS}
+        attempt_count = 0
+
+        for data in tasks:
+            columns["agent_index"].append(cls._to_int(data.get("agent_index")))
+            columns["task_index"].append(cls._to_int(data.get("task_index")))
+            columns["worker_index"].append(cls._to_int(data.get("worker_index")))
+            columns["scheduled_time"].append(cls._to_float(data.get("scheduled_time")))
+            columns["idle_time"].append(cls._to_float(data.get("idle_time")))
+            columns["create_attempt_count"].append(len(data["create_attempts"]))
+            columns["update_attempt_count"].append(len(data["update_attempts"]))
+            columns["deadline_exceeded"].append(cls._to_int(data.get("deadline_exceeded")))
+
+            for attempt in data["create_attempts"] + data["update_attempts"]:
+                timings = attempt.get("timings") or {}
+
+                for name in ["start_time", "end_time", "duration", "queue_time"]:
+                    columns[name].append(cls._to_float(attempt.get(name)))
+
+                for name in cls.TIMING_NAMES:
+                    columns[f"timing_{name}"].append(cls._to_float(timings.get(name)))
+
+                columns["ok"].append(cls._to_int(attempt.get("ok")))
+                columns["conflicts"].append(cls._to_int(attempt.get("conflicts")))
+                columns["retry_after"].append(cls._to_int(attempt.get("retry_after")))
+                columns["failure"].append(cls._get_failure_index(attempt))
+                attempt_count += 1
+
+        output = bytearray(struct.pack("<II", len(tasks), attempt_count))
+
+        for name, _ in cls.TASK_COLUMNS + cls.ATTEMPT_COLUMNS:
+            column = columns[name]
+
+            # Columns are always stored in little-endian byte order
+            if sys.byteorder == "big":
+                column.byteswap()
+
+            data = zlib.compress(column.tobytes(), 1)
+            output += struct.pack("<I", len(data)) + data
+
+        return output
+
+    @classmethod
+    def convert(cls, jsonl_path, file_path=None):
+        # Converts results saved as JSON lines, one task at a time, and returns the path of the new file
+        jsonl_path = Path(jsonl_path)
+        file_path = Path(file_path) if file_path else jsonl_path.with_suffix(cls.SUFFIX)
+
+        # Records other than tasks, e.g., samples of database activity, are kept in the header. They are found first so
+        # that the header can be written before the chunks
+        with open(jsonl_path, "r") as input_file:
+            records = [json.loads(line) for line in input_file if line.startswith('{"type":')]
+
+        # Results saved before headers were introduced start directly with the first task
+        header = next((record for record in records if record["type"] == "header"), {})
+        records = [record for record in records if record["type"] != "header"]
+
+        if records:
+            header = {**header, "records": records}
+
+        with open(jsonl_path, "r") as input_file, open(file_path, "wb") as output_file:
+            header_json = json.dumps(header).encode("utf-8")
+            output_file.write(cls.MAGIC + struct.pack("<I", len(header_json)) + header_json)
+            tasks = []
+
+            for line in input_file:
+                if line.startswith('{"type":') or not line.strip():
+                    continue
+
+                tasks.append(json.loads(line))
+
+                if len(tasks) >= cls.CHUNK_SIZE:
+                    output_file.write(cls._make_chunk(tasks))
+                    tasks = []
+
+            if tasks:
+                output_file.write(cls._make_chunk(tasks))
+
+        return file_path
+
+    @classmethod
+    def is_columnar(cls, file_path):
+        with open(file_path, "rb") as f:
+            return f.read(len(cls.MAGIC)) in [cls.MAGIC, cls.UNCLASSIFIED_MAGIC, cls.LEGACY_MAGIC]
+
+    def _read_header(self, view):
+        # Returns the header and the offset at which the first chunk starts
+        if bytes(view[:len(self.MAGIC)]) == self.LEGACY_MAGIC:
+            return {}, len(self.MAGIC)
+
+        (length,) = struct.unpack_from("<I", view, len(self.MAGIC))
+        start = len(self.MAGIC) + 4
+        return json.loads(bytes(view[start:start + length])), start + length
+
+    def load(self):
+        names = self.TASK_COLUMNS + self.ATTEMPT_COLUMNS
+        parts = {name: [] for name, _ in names}
+        self._task_count = 0
+        self._attempt_count = 0
+
+        # The file is mapped into memory so that each compressed column is decompressed without first being copied
+        with open(self.file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            self._header, offset = self._read_header(view)
+
+            # Columns added in later versions of the format are filled with missing values when reading older files
+            stored_names = names
+
+            if bytes(view[:len(self.MAGIC)]) != self.MAGIC:
+                stored_names = [(name, typecode) for name, typecode in names if name not in self.ADDED_COLUMNS]
+
+            while offset < len(view):
+                task_count, attempt_count = struct.unpack_from("<II", view, offset)
+                offset += 8
+
+                for name, typecode in stored_names:
+                    (length,) = struct.unpack_from("<I", view, offset)
+                    offset += 4
+                    parts[name].append(zlib.decompress(view[offset:offset + length]))
+                    offset += length
+
+                if stored_names is not names:
+                    parts["deadline_exceeded"].append(array("b", [-1] * task_count).tobytes())
+
+                self._task_count += task_count
+                self._attempt_count += attempt_count
+
+            view.release()
+
+        self._columns = {}
+
+        for name, typecode in names:
+            if name == "failure" and stored_names is not names:
+                continue
+
+            data = b"".join(parts[name])
+
+            if numpy is not None:
+                self._columns[name] = numpy.frombuffer(data, dtype=numpy.dtype(typecode).newbyteorder("<"))
+            else:
+                column = array(typecode)
+                column.frombytes(data)
+
+                if sys.byteorder == "big":
+                    column.byteswap()
+
+                self._columns[name] = column
+
+        if stored_names is not names:
+            self._columns["failure"] = self._get_unclassified_failures()
+
+        return self
+
+    def _get_unclassified_failures(self):
+        # Files written before failures were classified do not record their cause, so each failed attempt is given the
+        # cause "other", as it is when reading results saved as JSON lines
+        other = RequestAttempt.FAILURE_TYPES.index("other")
+        ok = self._columns["ok"]
+        retry_after = self._columns["retry_after"]
+
+        if numpy is not None:
+            return numpy.where((ok != 1) & (retry_after <= 0), other, -1).astype(numpy.int16)
+
+        return array("h", [
+            other if ok_value != 1 and retry_value <= 0 else -1 for ok_value, retry_value in zip(ok, retry_after)
+        ])
+
+    def get_tasks(self):
+        if self._columns is None:
+            self.load()
+
+        # Convert each column to a list once, replacing placeholders for missing values with None, as lists are much
+        # faster to index from Python than arrays
+        columns = {}
+
+        for name, typecode in self.TASK_COLUMNS + self.ATTEMPT_COLUMNS:
+            values = self._columns[name].tolist()
+
+            if typecode == "d":
+                columns[name] = [None if value != value else value for value in values]
+            elif typecode == "b":
+                columns[name] = [None if value < 0 else bool(value) for value in values]
+            else:
+                columns[name] = [None if value < 0 else value for value in values]
+
+        tasks = []
+        attempt_index = 0
+
+        for task_index in range(self.task_count):
+            task = ColumnarTask(columns, task_index, attempt_index)
+            attempt_index += columns["create_attempt_count"][task_index] + columns["update_attempt_count"][task_index]
+            tasks.append(task)
+
+        return tasks
+
+    def _get_task_values(self):
+        # Derives the values which AttestationTask computes from its attempts for every task at once, as NumPy arrays.
+        # Missing times are NaN, as are times of zero, which the tasks also treat as missing
+        columns = self.columns
+        create_counts = columns["create_attempt_count"].astype(numpy.int64)
+        update_counts = columns["update_attempt_count"].astype(numpy.int64)
+        update_starts = numpy.cumsum(create_counts + update_counts) - update_counts
+        has_create = create_counts > 0
+        has_update = update_counts > 0
+
+        # Index of the task of each attempt and whether the attempt is an update attempt
+        attempt_tasks = numpy.repeat(numpy.arange(self.task_count), create_counts + update_counts)
+        is_update = numpy.arange(self.attempt_count) >= update_starts[attempt_tasks]
+
+        ok = columns["ok"] == 1
+        durations = numpy.nan_to_num(columns["duration"])
+        start_times = _where_set(columns["start_time"])
+        end_times = _where_set(columns["end_time"])
+        last_creates = update_starts - 1
+        last_updates = update_starts + update_counts - 1
+
+        return {
+            "attempt_tasks": attempt_tasks,
+            "is_update": is_update,
+            "last_creates": last_creates[has_create],
+            "last_updates": last_updates[has_update],
+            "start_times": _pick(start_times, update_starts - create_counts, has_create, math.nan),
+            "end_times": numpy.where(
+                has_update,
+                _pick(end_times, last_updates, has_update, math.nan),
+                _pick(end_times, last_creates, has_create, math.nan)
+            ),
+            "create_successful": _pick(ok, last_creates, has_create, False),
+            "update_successful": _pick(ok, last_updates, has_update, False),
+            "create_durations": numpy.bincount(
+                attempt_tasks[~is_update], weights=durations[~is_update], minlength=self.task_count
+            ),
+            "update_durations": numpy.bincount(
+                attempt_tasks[is_update], weights=durations[is_update], minlength=self.task_count
+            ),
+            "retries": numpy.maximum(create_counts - 1, 0) + numpy.maximum(update_counts - 1, 0)
+        }
+
+    def get_time_range(self):
+        # Returns the earliest start time and latest end time of the tasks, or None for each if there are none. Requires
+        # NumPy
+        values = self._get_task_values()
+        start_times = values["start_times"][~numpy.isnan(values["start_times"])]
+        end_times = values["end_times"][~numpy.isnan(values["end_times"])]
+
+        return (
+            float(start_times.min()) if len(start_times) else None,
+            float(end_times.max()) if len(end_times) else None
+        )
+
+    def record_stats(self, stats, time_offset=0.0, worker_offset=0, agent_offset=0):
+        # Records every task into the given statistics straight from the columns, with the same result as recording each
+        # task with GlobalStats.record_task, but without building objects for the tasks and their attempts. Requires NumPy
+        columns = self.columns
+        values = self._get_task_values()
+        attempt_tasks = values["attempt_tasks"]
+        is_update = values["is_update"]
+        start_times = values["start_times"] + time_offset
+        end_times = values["end_times"] + time_offset
+        has_end = ~numpy.isnan(end_times)
+        create_successful = values["create_successful"]
+        update_successful = values["update_successful"]
+        create_durations = values["create_durations"]
+        update_durations = values["update_durations"]
+
+        if numpy.any(~numpy.isnan(start_times)):
+            stats.update_start_time(float(numpy.nanmin(start_times)))
+
+        if numpy.any(has_end):
+            stats.update_end_time(float(end_times[has_end].max()))
+
+        if self.task_count:
+            stats.update_worker_count(int(columns["worker_index"].max()) + 1 + worker_offset)
+            stats.update_agent_count(int(columns["agent_index"].max()) + 1 + agent_offset)
+
+        stats.agent_idle.record_many(columns["idle_time"])
+        stats.timeline.record_many(
+            end_times[has_end], update_successful[has_end], values["retries"][has_end], create_durations[has_end],
+            update_durations[has_end]
+        )
+
+        for phase_stats, successful, durations in [
+            (stats.create_phases, create_successful, create_durations),
+            (stats.update_phases, update_successful, update_durations),
+            (stats.full_protocol_runs, update_successful, create_durations + update_durations)
+        ]:
+            phase_stats.success.record_many(durations[successful])
+            phase_stats.fail.record_many(durations[~successful])
+
+        scheduled_latencies = values["end_times"] - columns["scheduled_time"]
+        stats.scheduled_runs.success.record_many(scheduled_latencies[update_successful])
+        stats.scheduled_runs.fail.record_many(scheduled_latencies[~update_successful])
+
+        stats.queue_waits.record_many(columns["queue_time"])
+
+        failures = columns["failure"]
+        durations = numpy.nan_to_num(columns["duration"])
+
+        for index, cause in enumerate(RequestAttempt.FAILURE_TYPES):
+            stats.failures.causes[cause].record_many(durations[failures == index])
+
+        deadline_exceeded = columns["deadline_exceeded"] == 1
+        stats.failures.record_deadline(int(numpy.count_nonzero(deadline_exceeded)))
+
+        # Backoffs are the gaps between consecutive attempts at the same request
+        same_request = (attempt_tasks[1:] == attempt_tasks[:-1]) & (is_update[1:] == is_update[:-1])
+        backoffs = _where_set(columns["start_time"])[1:] - _where_set(columns["end_time"])[:-1]
+        stats.retries.backoffs.record_many(numpy.maximum(backoffs[same_request], 0.0))
+
+        ok = columns["ok"] == 1
+        retry = ~ok & (columns["retry_after"] > 0)
+        last_attempts = numpy.concatenate([values["last_creates"], values["last_updates"]])
+        abandoned = retry[last_attempts] & ~deadline_exceeded[attempt_tasks[last_attempts]]
+        stats.retries.record_abandoned(int(numpy.count_nonzero(abandoned)))
+
+        phase_durations, connected = self._get_phase_durations()
+
+        for timing_stats, selected in [(stats.create_timings, ~is_update), (stats.update_timings, is_update)]:
+            selected = selected & ~numpy.isnan(phase_durations["receive"])
+            timing_stats.record_many({name: d[selected] for name, d in phase_durations.items()}, connected[selected])
+
+        for request_stats, selected in [(stats.create_requests, ~is_update), (stats.update_requests, is_update)]:
+            request_stats.ok.record_many(columns["duration"][selected & ok])
+            request_stats.retry.record_many(columns["duration"][selected & retry])
+            request_stats.fail.record_many(columns["duration"][selected & ~ok & ~retry])
+
+    def _get_phase_durations(self):
+        # Equivalent to RequestAttempt.phase_durations for every attempt at once, with NaN for attempts without timings,
+        # along with whether each attempt opened a new connection
+        columns = self.columns
+        timings = {name: _where_set(columns[f"timing_{name}"]) for name in self.TIMING_NAMES}
+
+        namelookup = numpy.nan_to_num(timings["namelookup"])
+        connect = numpy.where(numpy.isnan(timings["connect"]), namelookup, timings["connect"])
+        appconnect = numpy.where(numpy.isnan(timings["appconnect"]), connect, timings["appconnect"])
+        pretransfer = numpy.where(numpy.isnan(timings["pretransfer"]), appconnect, timings["pretransfer"])
+        starttransfer = numpy.where(numpy.isnan(timings["starttransfer"]), timings["total"], timings["starttransfer"])
+        has_timings = ~numpy.isnan(timings["total"])
+
+        phase_durations = {
+            "dns": namelookup,
+            "tcp": numpy.maximum(connect - namelookup, 0.0),
+            "tls": numpy.maximum(appconnect - connect, 0.0),
+            "wait": numpy.maximum(starttransfer - pretransfer, 0.0),
+            "receive": numpy.maximum(timings["total"] - starttransfer, 0.0)
+        }
+
+        phase_durations = {name: numpy.where(has_timings, d, math.nan) for name, d in phase_durations.items()}
+        return phase_durations, ~numpy.isnan(timings["connect"])
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def header(self):
+        if self._header is None:
+            # The header's length follows the magic number, so only the header itself needs to be read
+            with open(self.file_path, "rb") as f:
+                prefix = f.read(len(self.MAGIC) + 4)
+                has_header = prefix[:-4] in [self.MAGIC, self.UNCLASSIFIED_MAGIC]
+                length = struct.unpack_from("<I", prefix, len(self.MAGIC))[0] if has_header else 0
+                self._header, _ = self._read_header(memoryview(prefix + f.read(length)))
+
+        return self._header.copy()
+
+    @property
+    def columns(self):
+        # Maps each column name to a NumPy array, if NumPy is installed, or otherwise to an array.array
+        if self._columns is None:
+            self.load()
+
+        return self._columns.copy()
+
+    @property
+    def task_count(self):
+        return self._task_count
+
+    @property
+    def attempt_count(self):
+        return self._attempt_count
+
+
+def _where_set(values):
+    # Replaces values of zero with NaN, as zero stands for a missing time in the results
+    return numpy.where(values == 0, math.nan, values)
+
+
+def _pick(values, indices, mask, fill):
+    # Returns the values at the given indices where the mask is set, and the fill value elsewhere
+    result = numpy.full(len(indices), fill, dtype=values.dtype)
+    result[mask] = values[indices[mask]]
+    return result
+
+
+# Views of a single task, and each of its attempts, which read their values from the columns as needed
+class ColumnarTask(DeserializedTask):
+    def __init__(self, columns, index, first_attempt):
+        self._worker_index = columns["worker_index"][index]
+        self._agent = None
+        self._agent_index = columns["agent_index"][index]
+        self._index = columns["task_index"][index]
+        self._evidence = None
+
+        self._scheduled_time = columns["scheduled_time"][index]
+        self._idle_time = columns["idle_time"][index]
+        self._deadline = None
+        self._deadline_exceeded = bool(columns["deadline_exceeded"][index])
+        self._asyncio_task = None
+
+        update_start = first_attempt + columns["create_attempt_count"][index]
+        update_end = update_start + columns["update_attempt_count"][index]
+
+        self._create_attempts = [ColumnarAttempt(self, columns, i, "POST") for i in range(first_attempt, update_start)]
+        self._update_attempts = [ColumnarAttempt(self, columns, i, "PATCH") for i in range(update_start, update_end)]
+
+
+class ColumnarAttempt(DeserializedAttempt):
+    def __init__(self, task, columns, index, method):
+        self._task = task
+        self._columns = columns
+        self._index = index
+
+        # The URL of each request is not kept in the columnar format
+        self._method = method
+        self._url = None
+        self._request = None
+        self._response = None
+        self._exception = None
+
+    @property
+    def start_time(self):
+        return self._columns["start_time"][self._index]
+
+    @property
+    def end_time(self):
+        return self._columns["end_time"][self._index]
+
+    @property
+    def duration(self):
+        return self._columns["duration"][self._index]
+
+    @property
+    def queue_time(self):
+        return self._columns["queue_time"][self._index]
+
+    @property
+    def timings(self):
+        if self._columns["timing_total"][self._index] is None:
+            return None
+
+        return {name: self._columns[f"timing_{name}"][self._index] for name in ColumnarResults.TIMING_NAMES}
+
+    @property
+    def ok(self):
+        return self._columns["ok"][self._index]
+
+    @property
+    def conflicts(self):
+        return self._columns["conflicts"][self._index]
+
+    @property
+    def retry_after(self):
+        return self._columns["retry_after"][self._index]
+
+    @property
+    def failure(self):
+        index = self._columns["failure"][self._index]
+        return RequestAttempt.FAILURE_TYPES[index] if index is not None else None
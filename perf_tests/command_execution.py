@@ -17,23 +17,26 @@
 
 import os
 import sys
+import math
 import argparse
 
 from urllib.parse import urlparse, urlunparse
 
+from perf_tests.retry_policy import RetryPolicy
+
 
 class CommandExecution:
     @classmethod
     def _make_arg_parser(cls):
         parser = argparse.ArgumentParser(
             prog="run_perf_tests",
-            usage="run_perf_tests <verifier_url> <db_url> [options]",
+            usage="run_perf_tests <verifier_url> <db_url> [options]\n       run_perf_tests --self-benchmark <seconds> [options]",
             description="Runs performance tests against a Keylime verifier's push attestation endpoints",
         )
 
-        parser.add_argument('verifier_url', help="the URL at which to contact the verifier")
+        parser.add_argument('verifier_url', nargs="?", help="the URL at which to contact the verifier")
 
-        parser.add_argument('db_url', help="the URL at which to contact the verifier's database engine")
+        parser.add_argument('db_url', nargs="?", help="the URL at which to contact the verifier's database engine")
 
         parser.add_argument(
             "-w", "--workers",
@@ -59,6 +62,172 @@ class CommandExecution:
             help="the no. of attestation tasks to perform per agent (continues until stopped by default)"
         )
 
+        parser.add_argument(
+            "-r", "--rate",
+            metavar="<attestations_per_second>",
+            dest="rate",
+            default="0",
+            help="the no. of attestations to start per second across all workers, regardless of whether earlier "
+                 "attestations have completed (waits for an idle agent before starting each attestation by default)"
+        )
+
+        parser.add_argument(
+            "-c", "--max-connections",
+            metavar="<connection_count>",
+            dest="max_connections",
+            default="0",
+            help="the max. no. of concurrent connections each worker process may open to the verifier (uses the no. of "
+                 "agents per worker by default)"
+        )
+
+        parser.add_argument(
+            "--history",
+            metavar="<attestation_count>",
+            dest="history_count",
+            default="0",
+            help="the no. of past attestations to store in the database for each mock agent before testing begins, to "
+                 "measure the verifier's performance with a history of attestations (none by default)"
+        )
+
+        parser.add_argument(
+            "--connect-timeout",
+            metavar="<seconds>",
+            dest="connect_timeout",
+            default="20",
+            help="the max. time to wait for a connection to the verifier to be established, including the TLS handshake"
+        )
+
+        parser.add_argument(
+            "--request-timeout",
+            metavar="<seconds>",
+            dest="request_timeout",
+            default="45",
+            help="the max. time to wait for each request to complete, including establishing a connection"
+        )
+
+        parser.add_argument(
+            "--deadline",
+            metavar="<seconds>",
+            dest="deadline",
+            default="0",
+            help="the max. time each attestation may take, across all its requests and retries, after which it fails "
+                 "(no deadline by default)"
+        )
+
+        parser.add_argument(
+            "--retry-base-delay",
+            metavar="<seconds>",
+            dest="retry_base_delay",
+            default="1",
+            help="the delay before the first retry of a request which the verifier asked to be retried, which doubles "
+                 "with each further retry"
+        )
+
+        parser.add_argument(
+            "--retry-max-delay",
+            metavar="<seconds>",
+            dest="retry_max_delay",
+            default="30",
+            help="the max. delay between retries of the same request"
+        )
+
+        parser.add_argument(
+            "--retry-max-attempts",
+            metavar="<attempt_count>",
+            dest="retry_max_attempts",
+            default="0",
+            help="the max. no. of attempts at each request, after which the attestation fails (unlimited by default)"
+        )
+
+        parser.add_argument(
+            "--retry-budget",
+            metavar="<ratio>",
+            dest="retry_budget",
+            default="0",
+            help="the max. share of all requests, across all workers, which may be retries, e.g., '0.2' for 20%% "
+                 "(unlimited by default)"
+        )
+
+        parser.add_argument(
+            "--retry-jitter",
+            metavar="<mode>",
+            dest="retry_jitter",
+            choices=RetryPolicy.JITTER_MODES,
+            default="full",
+            help="whether to wait a random time of up to the delay before each retry ('full') or the delay exactly "
+                 "('none'), by default 'full'"
+        )
+
+        parser.add_argument(
+            "--retry-after",
+            metavar="<mode>",
+            dest="retry_after",
+            choices=RetryPolicy.RETRY_AFTER_MODES,
+            default="honour",
+            help="whether to wait for the time given by the verifier's Retry-After header before adding the delay "
+                 "('honour') or to use the delay alone ('override'), by default 'honour'"
+        )
+
+        parser.add_argument(
+            "-i", "--interval",
+            metavar="<seconds>",
+            dest="interval",
+            default="10",
+            help="the length of each interval in the timeline of throughput and latency included in the report"
+        )
+
+        parser.add_argument(
+            "--refresh",
+            metavar="<seconds>",
+            dest="refresh_interval",
+            default="5",
+            help="how often to refresh the status panel shown while tests are running ('0' to disable)"
+        )
+
+        parser.add_argument(
+            "--metrics-port",
+            metavar="<port>",
+            dest="metrics_port",
+            default="0",
+            help="serve live metrics in OpenMetrics format at /metrics on the given port (disabled by default)"
+        )
+
+        parser.add_argument(
+            "--db-sample-interval",
+            metavar="<seconds>",
+            dest="db_sample_interval",
+            default="5",
+            help="how often to record the activity of the verifier's database alongside the results, when using "
+                 "PostgreSQL ('0' to disable)"
+        )
+
+        parser.add_argument(
+            "--self-benchmark",
+            metavar="<seconds>",
+            dest="self_benchmark",
+            default="0",
+            help="measure the max. rate at which the tools can perform attestations, by testing for the given no. of "
+                 "seconds against a verifier which answers immediately from within each worker process, instead of a "
+                 "real verifier and database (uses 100 agents per worker by default)"
+        )
+
+        parser.add_argument(
+            "--profile",
+            dest="profile",
+            action="store_true",
+            default=False,
+            help="profile each worker process with cProfile, saving the profiles next to the results and summarising "
+                 "them at the end (adds significant overhead, so rates are lower than without profiling)"
+        )
+
+        parser.add_argument(
+            "--log-requests",
+            dest="log_requests",
+            action="store_true",
+            default=False,
+            help="output the outcome of every request as it completes"
+        )
+
         parser.add_argument(
             "-v", "--verbose",
             dest="verbose",
@@ -78,6 +247,26 @@ class CommandExecution:
             sys.exit(1)
         
         args = parser.parse_args()
+
+        try:
+            self_benchmark = float(args.self_benchmark)
+        except ValueError:
+            print("<seconds> must be a number")
+            sys.exit(1)
+
+        if self_benchmark < 0:
+            print("<seconds> must be '0' or greater")
+            sys.exit(1)
+
+        # When benchmarking the tools themselves, each worker answers its own requests and no database is used
+        if self_benchmark:
+            args.verifier_url = "http://127.0.0.1"
+            args.db_url = None
+        elif not args.verifier_url or not args.db_url:
+            parser.print_usage()
+            print("<verifier_url> and <db_url> are required")
+            sys.exit(1)
+
         verifier_url = urlparse(args.verifier_url, scheme="https")
         db_url = urlparse(args.db_url or "", scheme="postgresql")
 
@@ -106,11 +295,86 @@ class CommandExecution:
         if not args.task_count.isdigit():
             print("<task_count> must be an integer")
 
+        if not args.history_count.isdigit():
+            print("<attestation_count> must be an integer")
+            sys.exit(1)
+
+        if not args.max_connections.isdigit():
+            print("<connection_count> must be an integer")
+            sys.exit(1)
+
+        if not args.metrics_port.isdigit() or int(args.metrics_port) > 65535:
+            print("<port> must be an integer no greater than 65535")
+            sys.exit(1)
+
+        try:
+            rate = float(args.rate)
+        except ValueError:
+            print("<attestations_per_second> must be a number")
+            sys.exit(1)
+
+        try:
+            connect_timeout = float(args.connect_timeout)
+            request_timeout = float(args.request_timeout)
+            deadline = float(args.deadline)
+        except ValueError:
+            print("<seconds> must be a number")
+            sys.exit(1)
+
+        if connect_timeout <= 0 or request_timeout <= 0:
+            print("<seconds> must be greater than '0'")
+            sys.exit(1)
+
+        if deadline < 0:
+            print("<seconds> must be '0' or greater")
+            sys.exit(1)
+
+        try:
+            retry_base_delay = float(args.retry_base_delay)
+            retry_max_delay = float(args.retry_max_delay)
+        except ValueError:
+            print("<seconds> must be a number")
+            sys.exit(1)
+
+        if retry_base_delay < 0 or retry_max_delay < 0:
+            print("<seconds> must be '0' or greater")
+            sys.exit(1)
+
+        if not args.retry_max_attempts.isdigit():
+            print("<attempt_count> must be an integer")
+            sys.exit(1)
+
+        try:
+            retry_budget = float(args.retry_budget)
+        except ValueError:
+            print("<ratio> must be a number")
+            sys.exit(1)
+
+        if retry_budget < 0:
+            print("<ratio> must be '0' or greater")
+            sys.exit(1)
+
+        try:
+            interval = float(args.interval)
+            refresh_interval = float(args.refresh_interval)
+            db_sample_interval = float(args.db_sample_interval)
+        except ValueError:
+            print("<seconds> must be a number")
+            sys.exit(1)
+
         verifier_url = urlunparse(verifier_url)
-        db_url = urlunparse(db_url)
+        db_url = urlunparse(db_url) if args.db_url else None
         worker_count = int(args.worker_count)
         agent_count = int(args.agent_count)
         task_count = int(args.task_count)
+        max_connections = int(args.max_connections)
+        history_count = int(args.history_count)
+        retry_max_attempts = int(args.retry_max_attempts)
+        retry_jitter = args.retry_jitter
+        retry_after = args.retry_after
+        metrics_port = int(args.metrics_port)
+        profile = args.profile
+        log_requests = args.log_requests
         verbose = args.verbose
 
         if worker_count < 0:
@@ -125,22 +389,71 @@ class CommandExecution:
             print("<task_count> must be '0' or greater")
             sys.exit(1)
 
-        return cls(verifier_url, db_url, worker_count, agent_count, task_count, verbose)
+        if rate < 0:
+            print("<attestations_per_second> must be '0' or greater")
+            sys.exit(1)
 
-    def __init__(self, verifier_url, db_url, worker_count, agent_count, task_count, verbose):
+        if interval <= 0:
+            print("<seconds> must be greater than '0'")
+            sys.exit(1)
+
+        if refresh_interval < 0 or db_sample_interval < 0:
+            print("<seconds> must be '0' or greater")
+            sys.exit(1)
+
+        return cls(
+            verifier_url, db_url, worker_count, agent_count, task_count, rate, max_connections, history_count,
+            connect_timeout, request_timeout, deadline, retry_base_delay, retry_max_delay, retry_max_attempts,
+            retry_budget, retry_jitter, retry_after, interval, refresh_interval, metrics_port, db_sample_interval,
+            self_benchmark, profile, log_requests, verbose
+        )
+
+    def __init__(
+        self, verifier_url, db_url, worker_count, agent_count, task_count, rate, max_connections, history_count,
+        connect_timeout, request_timeout, deadline, retry_base_delay, retry_max_delay, retry_max_attempts,
+        retry_budget, retry_jitter, retry_after, interval, refresh_interval, metrics_port, db_sample_interval,
+        self_benchmark, profile, log_requests, verbose
+    ):
         if worker_count == 0:
             worker_count = os.cpu_count()
 
+        # A single agent per worker would leave each worker waiting on one request at a time when benchmarking
         if agent_count == 0:
-            agent_count = worker_count
+            agent_count = worker_count * 100 if self_benchmark else worker_count
+
+        if max_connections == 0:
+            max_connections = math.ceil(agent_count / worker_count)
 
         self._verifier_url = verifier_url
         self._db_url = db_url
         self._worker_count = worker_count
         self._agent_count = agent_count
         self._task_count = task_count
+        self._rate = rate
+        self._max_connections = max_connections
+        self._history_count = history_count
+        self._connect_timeout = connect_timeout
+        self._request_timeout = request_timeout
+        self._deadline = deadline
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._retry_max_attempts = retry_max_attempts
+        self._retry_budget = retry_budget
+        self._retry_jitter = retry_jitter
+        self._retry_after = retry_after
+        self._interval = interval
+        self._refresh_interval = refresh_interval
+        self._metrics_port = metrics_port
+        self._db_sample_interval = db_sample_interval
+        self._self_benchmark = self_benchmark
+        self._profile = profile
+        self._log_requests = log_requests
         self._verbose = verbose
 
+    def use_verifier_url(self, verifier_url):
+        # Allows a worker to direct its requests elsewhere, e.g., to a verifier running within the worker itself
+        self._verifier_url = verifier_url
+
     @property
     def verifier_url(self):
         return self._verifier_url
@@ -161,6 +474,90 @@ class CommandExecution:
     def task_count(self):
         return self._task_count
 
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def worker_rate(self):
+        if not self.rate:
+            return None
+
+        return self.rate / self.worker_count
+
+    @property
+    def max_connections(self):
+        return self._max_connections
+
+    @property
+    def history_count(self):
+        return self._history_count
+
+    @property
+    def connect_timeout(self):
+        return self._connect_timeout
+
+    @property
+    def request_timeout(self):
+        return self._request_timeout
+
+    @property
+    def deadline(self):
+        return self._deadline
+
+    @property
+    def retry_base_delay(self):
+        return self._retry_base_delay
+
+    @property
+    def retry_max_delay(self):
+        return self._retry_max_delay
+
+    @property
+    def retry_max_attempts(self):
+        return self._retry_max_attempts
+
+    @property
+    def retry_budget(self):
+        return self._retry_budget
+
+    @property
+    def retry_jitter(self):
+        return self._retry_jitter
+
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def refresh_interval(self):
+        return self._refresh_interval
+
+    @property
+    def metrics_port(self):
+        return self._metrics_port
+
+    @property
+    def db_sample_interval(self):
+        return self._db_sample_interval
+
+    @property
+    def self_benchmark(self):
+        return self._self_benchmark
+
+    @property
+    def profile(self):
+        return self._profile
+
+    @property
+    def log_requests(self):
+        # Requests are always logged in verbose mode
+        return self._log_requests or self.verbose
+
     @property
     def verbose(self):
         return self._verbose
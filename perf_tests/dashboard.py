@@ -0,0 +1,117 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import time
+
+from perf_tests.output import Table, ColumnGroup
+from perf_tests.stats import Histogram
+
+
+# Renders a status panel from the statistics shared by the worker processes, for display by the parent process while
+# tests are running. Rolling figures are calculated from the difference between the current statistics and those taken
+# at the previous refresh
+class Dashboard:
+    def __init__(self, task_manager, redraw=False):
+        self._task_manager = task_manager
+        self._redraw = redraw
+        self._start_time = time.perf_counter()
+        self._previous = self._take_snapshot()
+        self._line_count = 0
+
+    def _take_snapshot(self):
+        stats = self.task_manager.stats
+        requests = [stats.create_requests, stats.update_requests]
+
+        return {
+            "time": time.perf_counter(),
+            "attestations": stats.full_protocol_runs.all.count,
+            "failures": stats.full_protocol_runs.fail.count,
+            "requests": sum(request_stats.all.count for request_stats in requests),
+            "retries": sum(request_stats.retry.count for request_stats in requests),
+            "durations": stats.full_protocol_runs.all.histogram.counts
+        }
+
+    @staticmethod
+    def _get_figures(current, previous):
+        attestations = current["attestations"] - previous["attestations"]
+        requests = current["requests"] - previous["requests"]
+        durations = [a - b for a, b in zip(current["durations"], previous["durations"])]
+        p50, p99 = Histogram.percentiles_from_counts(durations, [50, 99])
+
+        return {
+            "rate": attestations / (current["time"] - previous["time"]),
+            "retry_rate": (current["retries"] - previous["retries"]) / requests if requests else None,
+            "fail_rate": (current["failures"] - previous["failures"]) / attestations if attestations else None,
+            "p50": p50,
+            "p99": p99
+        }
+
+    def make_group(self):
+        current = self._take_snapshot()
+        recent = self._get_figures(current, self._previous)
+        overall = self._get_figures(current, self._empty_snapshot)
+        self._previous = current
+
+        elapsed_f = str(datetime.timedelta(seconds=round(current["time"] - self._start_time)))
+        busy_count = self.task_manager.busy_count
+        agent_count = self.task_manager.agent_count
+
+        table = (
+            Table("<18", ">10", ">10")
+            .head("", "recent", "overall")
+            .decimals("Attestations/s", recent["rate"], overall["rate"])
+            .percents("Retried requests", recent["retry_rate"], overall["retry_rate"])
+            .percents("Failed tasks", recent["fail_rate"], overall["fail_rate"])
+            .times("Duration p50", recent["p50"], overall["p50"])
+            .times("Duration p99", recent["p99"], overall["p99"])
+            .row("")
+            .row("Tasks in flight", "", busy_count)
+            .percents("Busy agents", "", busy_count / agent_count if agent_count else None)
+            .row("Completed", "", current["attestations"])
+        )
+
+        return (
+            ColumnGroup()
+            .set_title(f"Running for {elapsed_f}", "^")
+            .add(table)
+        )
+
+    def refresh(self):
+        output = self.make_group().get_output()
+
+        # Move the cursor back to the start of the previous panel and clear it, so the panel is updated in place
+        if self._redraw and self._line_count:
+            print(f"\033[{self._line_count}F\033[J", end="")
+
+        print(output, flush=True)
+        self._line_count = output.count("\n") + 1
+
+    @property
+    def _empty_snapshot(self):
+        return {
+            "time": self._start_time,
+            "attestations": 0,
+            "failures": 0,
+            "requests": 0,
+            "retries": 0,
+            "durations": [0] * Histogram.bucket_count()
+        }
+
+    @property
+    def task_manager(self):
+        return self._task_manager
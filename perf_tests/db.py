@@ -15,36 +15,186 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import csv
+import io
 import json
 
-from sqlalchemy import create_engine, text
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import bindparam, create_engine, inspect, text
+
+from perf_tests.mock_history import MockHistory
 
 
 class DB:
     execution = None
     engine = None
 
+    # No. of mock agents created or deleted per transaction
+    BATCH_SIZE = 10000
+    # No. of past attestations stored or deleted per transaction
+    HISTORY_BATCH_SIZE = 2000
+    # No. of transactions performed concurrently, each on its own connection from the engine's pool
+    CONNECTION_COUNT = 4
+
+    AGENT_ID_PREFIX = "perf-test-agent-"
+    AGENT_COLUMNS = [
+        "agent_id", "tpm_policy", "accept_tpm_hash_algs", "accept_tpm_signing_algs", "supported_version", "ak_tpm",
+        "ima_policy_id", "mb_policy_id", "ima_pcrs"
+    ]
+    AGENT_VALUES = {
+        "tpm_policy": json.dumps({ "mask": "0xffff" }),
+        "accept_tpm_hash_algs": '["sha256", "sha1"]',
+        "accept_tpm_signing_algs": '["ecschnorr","rsassa"]',
+        "supported_version": "2.2",
+        "ak_tpm": "ARgAAQALAAUAcgAAABAAFAALCAAAAAAAAQDKCQgvW7DnsrfpQKm5GXULIdSgQsag5Q4sJnSDIHEw+Lm9LAVzmE5qwLyp3hNOCEslyPR46zNide/aRGBRy2RZS9vvZMPZim0iVoNU31nwV7+f2NZTi/I8c4owaPrL/Ti/VAT7uv7lrDvSxTOKNakdC4wBD5hMvERHwwAytgXKhpILXpvxj9LFtgUVGNtgjDXwqa1He+27CsZjL3g/oeILk1Mk590WMFcrD/TConyqlDDC3J+xdncC6KPuNPWqizUvHXrUtxD5wFqgPuMQvx3NxhPVgjtTFwT8QoDbRXAZQexk9TyZu2GrKqH9JPytwMDTIDroMe1ukCY4tS3iqMfh",
+        "ima_policy_id": 99999,
+        "mb_policy_id": 99999,
+        "ima_pcrs": "[10]"
+    }
+
     @classmethod
     def init_engine(cls, execution):
         cls.execution = execution
-        cls.engine = create_engine(execution.db_url)
+        cls.engine = create_engine(execution.db_url, pool_size=cls.CONNECTION_COUNT)
+
+    @classmethod
+    def _run_batches(cls, func, batches, progress=None, size=len):
+        # Performs each batch in its own transaction, several at a time, and reports the no. of items completed so far
+        # to the given callback, if any. Returns the total no. of items
+        total = sum(size(batch) for batch in batches)
+        done = 0
+
+        def run_batch(batch):
+            with cls.engine.begin() as db_conn:
+                func(db_conn, batch)
+
+            return size(batch)
+
+        if progress:
+            progress(done, total)
+
+        with ThreadPoolExecutor(cls.CONNECTION_COUNT) as executor:
+            for future in as_completed([executor.submit(run_batch, batch) for batch in batches]):
+                done += future.result()
+
+                if progress:
+                    progress(done, total)
+
+        return total
+
+    @classmethod
+    def _make_batches(cls, items):
+        return [items[i:i + cls.BATCH_SIZE] for i in range(0, len(items), cls.BATCH_SIZE)]
+
+    @classmethod
+    def _make_history_batches(cls, ranges):
+        # Splits ranges of attestation indices, each given as a tuple of an agent ID and the start and end of the range,
+        # into batches which together cover no more than HISTORY_BATCH_SIZE attestations
+        batches = [[]]
+        batch_size = 0
+
+        for agent_id, start, end in ranges:
+            while start < end:
+                batch_end = min(start + cls.HISTORY_BATCH_SIZE - batch_size, end)
+                batches[-1].append((agent_id, start, batch_end))
+                batch_size += batch_end - start
+                start = batch_end
+
+                if batch_size >= cls.HISTORY_BATCH_SIZE:
+                    batches.append([])
+                    batch_size = 0
+
+        return [batch for batch in batches if batch]
+
+    @staticmethod
+    def _get_history_batch_size(batch):
+        return sum(end - start for _, start, end in batch)
 
     @classmethod
-    def set_up(cls):
+    def set_up(cls, progress=None):
+        # The policies must be committed before any agents which refer to them are created by other connections
         with cls.engine.begin() as db_conn:
             cls.create_ima_policy(db_conn, "perf-test-policy")
             cls.create_uefi_refstate(db_conn, "perf-test-refstate")
 
-            for i in range(0, cls.execution.agent_count):
-                cls.create_agent(db_conn, f"perf-test-agent-{i}")
+        agent_ids = [f"{cls.AGENT_ID_PREFIX}{i}" for i in range(0, cls.execution.agent_count)]
+        return cls._run_batches(cls.create_agents, cls._make_batches(agent_ids), progress)
 
     @classmethod
-    def tear_down(cls):
+    def tear_down(cls, progress=None, history_progress=None):
+        # Agents are deleted by ID, in batches, rather than by a single pattern match over each table, so that no
+        # transaction holds locks on a large number of rows for long. As each agent may have any no. of past
+        # attestations, these are deleted first, in batches of their own
+        with cls.engine.connect() as db_conn:
+            agent_ids = cls.find_agents(db_conn, f"{cls.AGENT_ID_PREFIX}%")
+            history_ranges = cls.find_history(db_conn, f"{cls.AGENT_ID_PREFIX}%")
+
+        cls._run_batches(
+            cls.delete_history,
+            cls._make_history_batches(history_ranges),
+            history_progress,
+            size=cls._get_history_batch_size
+        )
+
+        agent_count = cls._run_batches(cls.delete_agents, cls._make_batches(agent_ids), progress)
+
         with cls.engine.begin() as db_conn:
-            cls.delete_agents(db_conn, "perf-test-agent-%")
             cls.delete_ima_policy(db_conn, "perf-test-policy")
             cls.delete_uefi_refstate(db_conn, "perf-test-refstate")
 
+        return agent_count
+
+    @classmethod
+    def seed_history(cls, attestation_count, progress=None):
+        # Stores the given no. of past attestations for each mock agent, split into batches of ranges of indices
+        history = MockHistory(
+            attestation_count,
+            cls._get_seed_columns("attestations", MockHistory.ATTESTATION_COLUMNS),
+            cls._get_seed_columns("evidence_items", MockHistory.EVIDENCE_COLUMNS)
+        )
+
+        ranges = [(f"{cls.AGENT_ID_PREFIX}{i}", 0, attestation_count) for i in range(0, cls.execution.agent_count)]
+
+        def seed_batch(db_conn, batch):
+            cls.create_history(db_conn, history, batch)
+
+        return cls._run_batches(
+            seed_batch, cls._make_history_batches(ranges), progress, size=cls._get_history_batch_size
+        )
+
+    @classmethod
+    def _get_seed_columns(cls, table, known_columns):
+        # Returns the columns of the table for which values can be generated, checking that all others are optional
+        columns = inspect(cls.engine).get_columns(table)
+
+        unknown_columns = [
+            column["name"] for column in columns
+            if column["name"] not in known_columns
+            and not column["nullable"]
+            and column.get("default") is None
+            and not column.get("identity")
+            and column.get("autoincrement") is not True
+        ]
+
+        if unknown_columns:
+            raise ValueError(f"cannot seed the '{table}' table without values for {', '.join(unknown_columns)}")
+
+        return [column["name"] for column in columns if column["name"] in known_columns]
+
+    @classmethod
+    def create_history(cls, db_conn, history, ranges):
+        attestation_rows = []
+        evidence_rows = []
+
+        for agent_id, start, end in ranges:
+            for index in range(start, end):
+                attestation_rows.append(history.attestation_row(agent_id, index))
+                evidence_rows.extend(history.evidence_rows(agent_id, index))
+
+        # Attestations must exist before the evidence items which refer to them
+        cls.insert_rows(db_conn, "attestations", history.attestation_columns, attestation_rows)
+        cls.insert_rows(db_conn, "evidence_items", history.evidence_columns, evidence_rows)
+
     @classmethod
     def create_ima_policy(cls, db_conn, name):
         with open("data/ima_runtime_policy.json", "r") as f:
@@ -74,24 +224,89 @@ class DB:
         db_conn.execute(text(f"DELETE FROM mbpolicies WHERE name='{name}'"))
 
     @classmethod
-    def create_agent(cls, db_conn, agent_id):
-        tpm_policy = { "mask": "0xffff" }
-        tpm_policy = json.dumps(tpm_policy)
+    def create_agents(cls, db_conn, agent_ids):
+        rows = [
+            [{**cls.AGENT_VALUES, "agent_id": agent_id}[column] for column in cls.AGENT_COLUMNS]
+            for agent_id in agent_ids
+        ]
+
+        cls.insert_rows(db_conn, "verifiermain", cls.AGENT_COLUMNS, rows)
+
+    @classmethod
+    def insert_rows(cls, db_conn, table, columns, rows):
+        quoted_columns = ", ".join(db_conn.dialect.identifier_preparer.quote(column) for column in columns)
+
+        if db_conn.dialect.name == "postgresql":
+            cls.copy_rows(db_conn, table, quoted_columns, rows)
+            return
+
+        # Other database engines receive all rows in a single executemany call, which SQLAlchemy batches into multi-row
+        # INSERT statements where the driver supports it
+        params = ", ".join(f":p{i}" for i in range(len(columns)))
+
+        db_conn.execute(
+            text(f"INSERT INTO {table} ({quoted_columns}) VALUES ({params})"),
+            [{f"p{i}": value for i, value in enumerate(row)} for row in rows]
+        )
 
-        db_conn.execute(text("""
-            INSERT INTO verifiermain (
-                agent_id, tpm_policy, accept_tpm_hash_algs, accept_tpm_signing_algs, 
-                supported_version, ak_tpm, ima_policy_id, mb_policy_id, ima_pcrs
-            ) VALUES (
-                :agent_id, :tpm_policy, '["sha256", "sha1"]', 
-                '["ecschnorr","rsassa"]', 2.2, 
-                'ARgAAQALAAUAcgAAABAAFAALCAAAAAAAAQDKCQgvW7DnsrfpQKm5GXULIdSgQsag5Q4sJnSDIHEw+Lm9LAVzmE5qwLyp3hNOCEslyPR46zNide/aRGBRy2RZS9vvZMPZim0iVoNU31nwV7+f2NZTi/I8c4owaPrL/Ti/VAT7uv7lrDvSxTOKNakdC4wBD5hMvERHwwAytgXKhpILXpvxj9LFtgUVGNtgjDXwqa1He+27CsZjL3g/oeILk1Mk590WMFcrD/TConyqlDDC3J+xdncC6KPuNPWqizUvHXrUtxD5wFqgPuMQvx3NxhPVgjtTFwT8QoDbRXAZQexk9TyZu2GrKqH9JPytwMDTIDroMe1ukCY4tS3iqMfh', 
-                99999, 99999, '[10]'
+    @classmethod
+    def copy_rows(cls, db_conn, table, quoted_columns, rows):
+        # Streams the rows to PostgreSQL as CSV using COPY, which avoids planning and executing an INSERT for each row.
+        # Values of None are written as unquoted empty fields, which COPY reads as NULL
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = db_conn.connection.cursor()
+
+        try:
+            cursor.copy_expert(f"COPY {table} ({quoted_columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+    @classmethod
+    def find_agents(cls, db_conn, agent_id_pattern):
+        result = db_conn.execute(
+            text("SELECT agent_id FROM verifiermain WHERE agent_id LIKE :pattern"), {"pattern": agent_id_pattern}
+        )
+
+        return [row[0] for row in result]
+
+    @classmethod
+    def find_history(cls, db_conn, agent_id_pattern):
+        # Returns the range of indices of the past attestations of each matching agent
+        index = db_conn.dialect.identifier_preparer.quote("index")
+
+        result = db_conn.execute(
+            text(
+                f"SELECT agent_id, MIN({index}), MAX({index}) FROM attestations WHERE agent_id LIKE :pattern "
+                f"GROUP BY agent_id"
+            ),
+            {"pattern": agent_id_pattern}
+        )
+
+        return [(row[0], row[1], row[2] + 1) for row in result]
+
+    @classmethod
+    def delete_history(cls, db_conn, ranges):
+        # Evidence items refer to their attestations, so they are deleted first
+        index = db_conn.dialect.identifier_preparer.quote("index")
+        params = [{"agent_id": agent_id, "start": start, "end": end} for agent_id, start, end in ranges]
+
+        for table, index_column in [("evidence_items", "attestation_index"), ("attestations", index)]:
+            db_conn.execute(
+                text(
+                    f"DELETE FROM {table} WHERE agent_id = :agent_id "
+                    f"AND {index_column} >= :start AND {index_column} < :end"
+                ),
+                params
             )
-        """), {"agent_id": agent_id, "tpm_policy": tpm_policy})
 
     @classmethod
-    def delete_agents(cls, db_conn, agent_id_pattern):
-        db_conn.execute(text(f"DELETE FROM evidence_items WHERE agent_id LIKE '{agent_id_pattern}'"))
-        db_conn.execute(text(f"DELETE FROM attestations WHERE agent_id LIKE '{agent_id_pattern}'"))
-        db_conn.execute(text(f"DELETE FROM verifiermain WHERE agent_id LIKE '{agent_id_pattern}'"))
+    def delete_agents(cls, db_conn, agent_ids):
+        for table in ["evidence_items", "attestations", "verifiermain"]:
+            db_conn.execute(
+                text(f"DELETE FROM {table} WHERE agent_id IN :agent_ids").bindparams(
+                    bindparam("agent_ids", expanding=True)
+                ),
+                {"agent_ids": agent_ids}
+            )
@@ -0,0 +1,320 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import bisect
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from perf_tests.output import OutputHelpers, Table, ColumnGroup
+
+
+# Periodically samples PostgreSQL's statistics views while tests are running, so that spikes in latency can be matched
+# against the activity of the database at the time. The sampler runs in a thread of the parent process, using its own
+# connection, and sends each sample to the results file alongside the tasks. Counters which only ever increase, like
+# the no. of transactions committed, are recorded as rates over the time since the previous sample
+class DBActivitySampler:
+    RECORD_TYPE = "db_sample"
+    # No. of queries included in each sample, ordered by the time spent executing them since the previous sample
+    TOP_QUERY_COUNT = 5
+    # Max. length of the query text included in each sample
+    QUERY_LENGTH = 200
+
+    ACTIVITY_QUERY = """
+        SELECT
+            count(*) AS connections,
+            count(*) FILTER (WHERE state = 'active') AS active,
+            count(*) FILTER (WHERE state = 'idle in transaction') AS idle_in_transaction,
+            count(*) FILTER (WHERE wait_event_type = 'Lock') AS waiting_on_locks
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND pid <> pg_backend_pid()
+    """
+
+    DATABASE_QUERY = """
+        SELECT xact_commit AS commits, xact_rollback AS rollbacks, deadlocks, blks_hit, blks_read
+        FROM pg_stat_database
+        WHERE datname = current_database()
+    """
+
+    LOCKS_QUERY = """
+        SELECT count(*) AS ungranted_locks
+        FROM pg_locks
+        WHERE NOT granted
+    """
+
+    # PostgreSQL 13 renamed total_time to total_exec_time
+    STATEMENTS_QUERY = """
+        SELECT queryid, left(query, :length) AS query, calls, {total_column} AS total_time
+        FROM pg_stat_statements
+        WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    """
+
+    def __init__(self, engine, serializer, interval):
+        self._engine = engine
+        self._serializer = serializer
+        self._interval = interval
+        self._samples = []
+        self._previous = None
+        self._statements_column = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _find_statements_column(self, db_conn):
+        # Returns the column which holds the total execution time of each statement, or None if pg_stat_statements is
+        # not installed in the database being sampled
+        with db_conn.begin():
+            query = text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_stat_statements'")
+            installed = db_conn.execute(query).scalar()
+            version = int(db_conn.execute(text("SHOW server_version_num")).scalar())
+
+        if not installed:
+            return None
+
+        return "total_exec_time" if version >= 130000 else "total_time"
+
+    def _query_counters(self, db_conn):
+        counters = dict(db_conn.execute(text(self.DATABASE_QUERY)).mappings().one())
+        counters["statements"] = {}
+
+        if not self._statements_column:
+            return counters
+
+        query = text(self.STATEMENTS_QUERY.format(total_column=self._statements_column))
+
+        # The extension may be installed without its library being loaded, in which case reading it raises an error
+        try:
+            with db_conn.begin_nested():
+                for row in db_conn.execute(query, {"length": self.QUERY_LENGTH}).mappings():
+                    counters["statements"][row["queryid"]] = (row["query"], row["calls"], row["total_time"])
+        except SQLAlchemyError:
+            self._statements_column = None
+
+        return counters
+
+    def _get_top_queries(self, statements, previous_statements):
+        queries = []
+
+        for query_id, (query, calls, total_time) in statements.items():
+            _, previous_calls, previous_total_time = previous_statements.get(query_id, (None, 0, 0.0))
+            calls -= previous_calls
+            total_time -= previous_total_time
+
+            # Times are reported by pg_stat_statements in milliseconds
+            if calls > 0:
+                queries.append({"query": query, "calls": calls, "total_time": total_time / 1000})
+
+        queries.sort(key=lambda q: q["total_time"], reverse=True)
+        return queries[:self.TOP_QUERY_COUNT]
+
+    def take_sample(self, db_conn):
+        sample_time = time.perf_counter()
+        counters = self._query_counters(db_conn)
+
+        sample = {
+            "type": self.RECORD_TYPE,
+            "time": sample_time,
+            **db_conn.execute(text(self.ACTIVITY_QUERY)).mappings().one(),
+            **db_conn.execute(text(self.LOCKS_QUERY)).mappings().one()
+        }
+
+        # Rates can only be calculated once there is a previous sample to compare against
+        if self._previous:
+            previous_time, previous = self._previous
+            elapsed = sample_time - previous_time
+            blocks = (counters["blks_hit"] - previous["blks_hit"]) + (counters["blks_read"] - previous["blks_read"])
+
+            sample.update({
+                "commits_per_second": (counters["commits"] - previous["commits"]) / elapsed,
+                "rollbacks_per_second": (counters["rollbacks"] - previous["rollbacks"]) / elapsed,
+                "deadlocks": counters["deadlocks"] - previous["deadlocks"],
+                "cache_hit_ratio": (counters["blks_hit"] - previous["blks_hit"]) / blocks if blocks else None,
+                "top_queries": self._get_top_queries(counters["statements"], previous["statements"])
+            })
+
+        self._previous = (sample_time, counters)
+        return sample
+
+    def _run(self):
+        try:
+            with self._engine.connect() as db_conn:
+                self._statements_column = self._find_statements_column(db_conn)
+
+                while not self._stop_event.is_set():
+                    # Each sample is read in a transaction of its own, as the statistics views return the same values
+                    # for the duration of a transaction
+                    with db_conn.begin():
+                        sample = self.take_sample(db_conn)
+
+                    self._samples.append(sample)
+                    self._serializer.write_record(sample)
+                    self._stop_event.wait(self.interval)
+        except SQLAlchemyError as exc:
+            print(f"\nStopped sampling database activity due to an error: {exc}\n")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Must be called before the serializer's writer is stopped, so that no samples are lost
+        if not self._thread:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def samples(self):
+        return self._samples.copy()
+
+    @property
+    def statements_available(self):
+        return self._statements_column is not None
+
+
+# Summarises samples of database activity, either from a running test or from saved results, in the same intervals as
+# the timeline of attestations so that the two can be compared row by row
+class DBActivityReport:
+    # No. of queries listed in the summary of the queries which took the most time across the run
+    TOP_QUERY_COUNT = 5
+
+    def __init__(self, samples, timeline):
+        self._samples = sorted(samples, key=lambda sample: sample["time"])
+        self._sample_times = [sample["time"] for sample in self._samples]
+        self._timeline = timeline
+
+    @staticmethod
+    def _mean(values):
+        values = [value for value in values if value is not None]
+        return sum(values) / len(values) if values else None
+
+    def get_rows(self):
+        rows = []
+
+        for timeline_row in self.timeline.get_rows():
+            start = self.timeline.origin + timeline_row["start"]
+            end = start + timeline_row["duration"]
+
+            # The samples are sorted by time, so those within the row are found by binary search
+            samples = self._samples[
+                bisect.bisect_left(self._sample_times, start):bisect.bisect_left(self._sample_times, end)
+            ]
+
+            rows.append({
+                "start": timeline_row["start"],
+                "connections": max([sample["connections"] for sample in samples], default=None),
+                "active": max([sample["active"] for sample in samples], default=None),
+                "waiting_on_locks": max([sample["waiting_on_locks"] for sample in samples], default=None),
+                "commits_per_second": self._mean([sample.get("commits_per_second") for sample in samples]),
+                "rollbacks_per_second": self._mean([sample.get("rollbacks_per_second") for sample in samples]),
+                "deadlocks": sum(sample.get("deadlocks") or 0 for sample in samples) if samples else None,
+                "cache_hit_ratio": self._mean([sample.get("cache_hit_ratio") for sample in samples])
+            })
+
+        return rows
+
+    def get_top_queries(self):
+        # Combines the queries recorded in each sample to find those which took the most time across the whole run
+        queries = {}
+
+        for sample in self._samples:
+            for query in sample.get("top_queries") or []:
+                total = queries.setdefault(query["query"], {"query": query["query"], "calls": 0, "total_time": 0.0})
+                total["calls"] += query["calls"]
+                total["total_time"] += query["total_time"]
+
+        return sorted(queries.values(), key=lambda q: q["total_time"], reverse=True)[:self.TOP_QUERY_COUNT]
+
+    def make_table(self, rows):
+        table = (
+            Table("<9", ">6", ">6", ">7", ">8", ">8", ">6", ">7")
+            .head("elapsed", "conns", "active", "lock wt", "commit/s", "rollbk/s", "dlocks", "hit %")
+        )
+
+        for row in rows:
+            minutes, seconds = divmod(row["start"], 60)
+            hours, minutes = divmod(int(minutes), 60)
+            seconds_f = f"{seconds:02.0f}" if float(self.timeline.interval).is_integer() else f"{seconds:04.1f}"
+            cells = [row[key] for key in ["connections", "active", "waiting_on_locks"]]
+            rates = [row[key] for key in ["commits_per_second", "rollbacks_per_second"]]
+            hit_ratio = row["cache_hit_ratio"]
+
+            table = table.row(
+                f"{hours}:{minutes:02}:{seconds_f}",
+                *[cell if cell is not None else "--" for cell in cells],
+                *[f"{round(rate, 1)}" if rate is not None else "--" for rate in rates],
+                row["deadlocks"] if row["deadlocks"] is not None else "--",
+                f"{round(hit_ratio * 100, 1)}%" if hit_ratio is not None else "--"
+            )
+
+        return table
+
+    def make_query_table(self, queries):
+        table = (
+            Table("<56", ">8", ">8", ">7")
+            .head("query", "calls", "total", "mean")
+        )
+
+        for query in queries:
+            table = table.row(
+                " ".join(query["query"].split())[:56],
+                query["calls"],
+                OutputHelpers.format_duration(query["total_time"]),
+                OutputHelpers.format_duration(query["total_time"] / query["calls"])
+            )
+
+        return table
+
+    def print(self):
+        if not self._samples:
+            return
+
+        activity_group = (
+            ColumnGroup()
+            .set_title("Database Activity", "^")
+            .add(OutputHelpers.center(self.make_table(self.get_rows()).output, 80))
+        )
+
+        print(OutputHelpers.center(activity_group.get_output(), 103))
+
+        queries = self.get_top_queries()
+
+        if queries:
+            query_group = (
+                ColumnGroup()
+                .set_title("Queries Taking the Most Time", "^")
+                .add(OutputHelpers.center(self.make_query_table(queries).output, 90))
+            )
+
+            print(OutputHelpers.center(query_group.get_output(), 103))
+
+        print("")
+
+    @property
+    def timeline(self):
+        return self._timeline
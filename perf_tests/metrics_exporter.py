@@ -0,0 +1,183 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from perf_tests.stats import Histogram
+
+
+# Serves the statistics shared by the worker processes in the OpenMetrics text format so that they can be scraped by
+# Prometheus. The server runs in a thread of the parent process and only reads from shared memory, so the workers do no
+# additional work when metrics are collected
+class MetricsExporter:
+    PREFIX = "keylime_perf"
+    CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+    # Upper bounds (in seconds) of the histogram buckets exposed, which are derived from the finer-grained histograms
+    # kept by each StatCounter
+    BUCKET_BOUNDS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+    def __init__(self, task_manager, port):
+        self._task_manager = task_manager
+        self._port = port
+        self._server = None
+
+    def _make_handler(self):
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", exporter.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes should not be interleaved with the output of the tests
+                pass
+
+        return Handler
+
+    def listen(self):
+        # Binds the port without serving any requests yet, so that a port which is in use can be reported before the
+        # tests begin. Raises OSError if the port cannot be bound
+        self._server = ThreadingHTTPServer(("", self.port), self._make_handler())
+        return self
+
+    def start(self):
+        if not self._server:
+            self.listen()
+
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+
+        pairs = [f'{name}="{value}"' for name, value in labels.items()]
+        return "{" + ",".join(pairs) + "}"
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float):
+            return repr(value)
+
+        return str(value)
+
+    def _add_family(self, lines, name, metric_type, help_text, samples):
+        name = f"{self.PREFIX}_{name}"
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {help_text}")
+
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{self._format_labels(labels)} {self._format_value(value)}")
+
+    def _histogram_samples(self, counter, labels=None):
+        labels = labels or {}
+        counts = counter.histogram.counts
+        cumulative_counts = Histogram.cumulative_from_counts(counts, self.BUCKET_BOUNDS)
+        samples = []
+
+        for bound, cumulative_count in zip(self.BUCKET_BOUNDS, cumulative_counts):
+            samples.append(("_bucket", {**labels, "le": repr(float(bound))}, cumulative_count))
+
+        samples.append(("_bucket", {**labels, "le": "+Inf"}, sum(counts)))
+        samples.append(("_count", labels, sum(counts)))
+        samples.append(("_sum", labels, float(counter.total_duration or 0.0)))
+
+        return samples
+
+    def render(self):
+        stats = self.task_manager.stats
+        lines = []
+
+        self._add_family(lines, "attestations", "counter", "Attestation tasks completed, by outcome", [
+            ("_total", {"outcome": "success"}, stats.full_protocol_runs.success.count),
+            ("_total", {"outcome": "fail"}, stats.full_protocol_runs.fail.count)
+        ])
+
+        request_samples = []
+
+        for phase, request_stats in [("create", stats.create_requests), ("update", stats.update_requests)]:
+            for outcome in ["ok", "retry", "fail"]:
+                count = getattr(request_stats, outcome).count
+                request_samples.append(("_total", {"phase": phase, "outcome": outcome}, count))
+
+        self._add_family(lines, "requests", "counter", "Requests sent to the verifier, by phase and outcome",
+                         request_samples)
+
+        self._add_family(lines, "request_failures", "counter", "Requests which failed, by cause", [
+            ("_total", {"cause": cause}, counter.count) for cause, counter in stats.failures.causes.items()
+        ])
+
+        self._add_family(lines, "deadlines_exceeded", "counter", "Attestation tasks given up on at their deadline", [
+            ("_total", None, stats.failures.deadline_count)
+        ])
+
+        self._add_family(lines, "missed_slots", "counter", "Fixed-rate slots skipped as no agent was idle", [
+            ("_total", None, stats.missed_slots)
+        ])
+
+        self._add_family(
+            lines, "attestation_duration_seconds", "histogram", "Time taken to complete each attestation task",
+            self._histogram_samples(stats.full_protocol_runs.all)
+        )
+
+        self._add_family(
+            lines, "request_duration_seconds", "histogram", "Time taken to receive a response to each request",
+            self._histogram_samples(stats.create_requests.all, {"phase": "create"})
+            + self._histogram_samples(stats.update_requests.all, {"phase": "update"})
+        )
+
+        self._add_family(lines, "tasks_in_flight", "gauge", "Attestation tasks currently in progress", [
+            ("", None, self.task_manager.busy_count)
+        ])
+
+        self._add_family(lines, "agents", "gauge", "Mock agents, by state", [
+            ("", {"state": "busy"}, self.task_manager.busy_count),
+            ("", {"state": "idle"}, self.task_manager.leases.idle_count)
+        ])
+
+        self._add_family(
+            lines, "event_loop_lag_seconds", "gauge", "How late the event loop of each worker last woke from a timer",
+            [("", {"worker": i}, lag) for i, lag in enumerate(self.task_manager.worker_load.latest_lags)]
+        )
+
+        self._add_family(
+            lines, "worker_cpu_ratio", "gauge", "Share of the time each worker spent on the CPU since its last probe",
+            [("", {"worker": i}, cpu) for i, cpu in enumerate(self.task_manager.worker_load.latest_cpu)]
+        )
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    @property
+    def task_manager(self):
+        return self._task_manager
+
+    @property
+    def port(self):
+        return self._port
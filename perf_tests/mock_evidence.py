@@ -15,10 +15,31 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import json
+
 from perf_tests.certification import *
 from perf_tests.event_log import *
 
 
+# Request bodies are serialised once per worker process and reused for every attestation and retry, as rendering and
+# encoding the event logs for each request would otherwise account for most of the CPU time used by the workers
+class EvidencePayloads:
+    def __init__(self, evidence):
+        evidence_supported = json.dumps([ item.render_supported() for item in evidence ])
+        evidence_collected = json.dumps([ item.render_collected() for item in evidence ])
+
+        self._create_body_prefix = f'{{"evidence_supported": {evidence_supported}, "system_info": {{"boot_time": '.encode()
+        self._update_body = f'{{"evidence_collected": {evidence_collected}}}'.encode()
+
+    def create_body(self, boot_time):
+        # Only the boot time differs between agents, so it is appended to the otherwise identical body
+        return self._create_body_prefix + json.dumps(boot_time).encode() + b"}}"
+
+    @property
+    def update_body(self):
+        return self._update_body
+
+
 class MockTPMQuote(Certification):
     def __init__(self):
         self.evidence_type = "tpm_quote"
@@ -0,0 +1,122 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+
+from datetime import datetime, timedelta, timezone
+
+from perf_tests.mock_evidence import MockTPMQuote, MockUEFILog, MockIMALog
+
+
+# Generates rows for the attestations and evidence_items tables which resemble those the verifier stores for completed
+# attestations, so that the database can be filled with a history of past attestations before testing begins. Each
+# agent's past attestations are spaced INTERVAL apart, ending at the time the history is generated.
+#
+# Values are produced for each column found in the verifier's schema which is known here. Other columns are left to
+# their defaults, or NULL, so that the rows remain valid as the schema changes. The entries of event logs are not
+# stored, as they would make each row hundreds of kilobytes in size and so limit the history which can be generated
+class MockHistory:
+    INTERVAL = timedelta(minutes=2)
+
+    ATTESTATION_COLUMNS = [
+        "agent_id", "index", "stage", "evaluation", "failure_reason", "boot_time", "capabilities_received_at",
+        "challenges_expire_at", "evidence_received_at", "verification_completed_at"
+    ]
+    EVIDENCE_COLUMNS = [
+        "agent_id", "attestation_index", "evidence_class", "evidence_type", "capabilities", "chosen_parameters", "data"
+    ]
+
+    def __init__(self, attestation_count, attestation_columns, evidence_columns):
+        self._attestation_count = attestation_count
+        self._attestation_columns = attestation_columns
+        self._evidence_columns = evidence_columns
+        self._end_time = datetime.now(timezone.utc)
+        self._evidence = [MockTPMQuote(), MockUEFILog(), MockIMALog()]
+
+        # The fields of each evidence item are identical across attestations, so they are rendered only once
+        self._evidence_fields = [self._render_evidence(item) for item in self._evidence]
+
+    @staticmethod
+    def _render_evidence(item):
+        supported = item.render_supported()
+        data = item.data.render()
+
+        if supported["evidence_class"] == "log":
+            chosen_parameters = {"starting_offset": 0, "format": supported["capabilities"]["formats"][0]}
+            data = {**data, "entries": ""}
+        else:
+            capabilities = supported["capabilities"]
+            chosen_parameters = {
+                "hash_algorithm": capabilities["hash_algorithms"][0],
+                "signature_scheme": capabilities["signature_schemes"][0],
+                "selected_subjects": {capabilities["hash_algorithms"][0]: [0, 1, 2, 3, 4, 5, 6, 7, 10]},
+                "certification_key": capabilities["certification_keys"][0]
+            }
+
+        return {
+            "evidence_class": supported["evidence_class"],
+            "evidence_type": supported["evidence_type"],
+            "capabilities": json.dumps(supported["capabilities"]),
+            "chosen_parameters": json.dumps(chosen_parameters),
+            "data": json.dumps(data)
+        }
+
+    @staticmethod
+    def _select(values, columns):
+        return [values.get(column) for column in columns]
+
+    def _get_times(self, index):
+        received_at = self._end_time - self.INTERVAL * (self.attestation_count - index)
+
+        return {
+            # Matches the boot time reported by the agent when the attestation was created (see Agent.boot_time)
+            "boot_time": datetime.fromtimestamp(index + 1, tz=timezone.utc),
+            "capabilities_received_at": received_at,
+            "challenges_expire_at": received_at + timedelta(minutes=30),
+            "evidence_received_at": received_at + timedelta(milliseconds=50),
+            "verification_completed_at": received_at + timedelta(milliseconds=150)
+        }
+
+    def attestation_row(self, agent_id, index):
+        values = {
+            "agent_id": agent_id,
+            "index": index,
+            "stage": "verification_complete",
+            "evaluation": "pass",
+            "failure_reason": None,
+            **self._get_times(index)
+        }
+
+        return self._select(values, self._attestation_columns)
+
+    def evidence_rows(self, agent_id, index):
+        return [
+            self._select({"agent_id": agent_id, "attestation_index": index, **fields}, self._evidence_columns)
+            for fields in self._evidence_fields
+        ]
+
+    @property
+    def attestation_count(self):
+        return self._attestation_count
+
+    @property
+    def attestation_columns(self):
+        return self._attestation_columns.copy()
+
+    @property
+    def evidence_columns(self):
+        return self._evidence_columns.copy()
@@ -0,0 +1,292 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import asyncio
+import ctypes
+import random
+import time
+
+from multiprocessing import RawArray
+
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id
+from tornado.web import Application, RequestHandler
+
+from perf_tests.output import OutputHelpers
+
+
+# A distribution from which the time taken by the mock verifier to respond to a request is drawn. Distributions are
+# given as "<kind>:<params>", with all times in milliseconds, or as a single number for a fixed latency
+class LatencyDistribution:
+    KINDS = {
+        "fixed": 1,
+        "uniform": 2,
+        "normal": 2,
+        "lognormal": 2,
+        "exponential": 1
+    }
+
+    def __init__(self, kind, params):
+        if kind not in self.KINDS:
+            raise ValueError(f"unknown latency distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+
+        if len(params) != self.KINDS[kind]:
+            raise ValueError(f"the '{kind}' latency distribution takes {self.KINDS[kind]} parameter(s)")
+
+        if any(param < 0 for param in params):
+            raise ValueError("latency distribution parameters must be '0' or greater")
+
+        self._kind = kind
+        self._params = params
+
+    @classmethod
+    def parse(cls, spec):
+        kind, _, params = spec.partition(":") if ":" in spec else ("fixed", None, spec)
+
+        try:
+            params = [float(param) for param in params.split(",")]
+        except ValueError:
+            raise ValueError(f"invalid parameters for the '{kind}' latency distribution: {params}")
+
+        return cls(kind, params)
+
+    def sample(self):
+        # Returns a latency in seconds, never less than zero
+        match self.kind:
+            case "fixed":
+                millis = self.params[0]
+            case "uniform":
+                millis = random.uniform(*self.params)
+            case "normal":
+                millis = random.gauss(*self.params)
+            case "lognormal":
+                # Given as the median and the standard deviation of the underlying normal distribution
+                millis = self.params[0] * random.lognormvariate(0, self.params[1])
+            case "exponential":
+                millis = random.expovariate(1 / self.params[0]) if self.params[0] else 0.0
+
+        return max(millis, 0.0) / 1000
+
+    @property
+    def kind(self):
+        return self._kind
+
+    @property
+    def params(self):
+        return self._params.copy()
+
+
+# Behaviour of the mock verifier, shared by all of its processes
+class MockVerifierConfig:
+    def __init__(
+        self, create_latency, update_latency, conflict_rate=0.0, retry_after=1, error_rate=0.0, max_rate=0.0
+    ):
+        self.create_latency = create_latency
+        self.update_latency = update_latency
+        self.conflict_rate = conflict_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+
+    @classmethod
+    def immediate(cls):
+        # Answers every request successfully without delay
+        no_latency = LatencyDistribution("fixed", [0.0])
+        return cls(no_latency, no_latency)
+
+
+# Lightweight stand-in for the push attestation endpoints of a Keylime verifier, for testing the performance tests
+# themselves without a real verifier or database. Evidence is neither stored nor verified: a request is answered after
+# a latency drawn from the configured distribution, unless it is chosen at random to fail with a conflict or an error.
+# The rate at which requests are answered can be capped, in which case requests queue for their turn, as they would at
+# a saturated verifier. Each process counts the requests it answers in its own slot of a shared array, which the first
+# process sums up to report the overall rate
+class MockVerifier:
+    # Request outcomes which are counted
+    OUTCOMES = ["created", "updated", "conflicts", "errors"]
+
+    def __init__(self, config, port, process_count=1, ssl_options=None, report_interval=5):
+        self._config = config
+        self._port = port
+        self._process_count = process_count
+        self._ssl_options = ssl_options
+        self._report_interval = report_interval
+        self._counts = RawArray(ctypes.c_ulonglong, process_count * len(self.OUTCOMES))
+        self._latest_indices = {}
+        self._next_slot = 0.0
+
+    @staticmethod
+    def _process_index():
+        # The ID of the current process when several were forked, or zero when only one process is in use
+        return task_id() or 0
+
+    def _count(self, outcome):
+        self._counts[self._process_index() * len(self.OUTCOMES) + self.OUTCOMES.index(outcome)] += 1
+
+    def _get_totals(self):
+        totals = dict.fromkeys(self.OUTCOMES, 0)
+
+        for i, count in enumerate(self._counts):
+            totals[self.OUTCOMES[i % len(self.OUTCOMES)]] += count
+
+        return totals
+
+    async def _wait_for_turn(self):
+        # Each process answers its share of the max. rate, with requests queued in the order they arrive
+        if not self.config.max_rate:
+            return
+
+        interval = self.process_count / self.config.max_rate
+        now = time.perf_counter()
+        slot = max(self._next_slot, now)
+        self._next_slot = slot + interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def respond(self, handler, latency, respond_ok):
+        await self._wait_for_turn()
+        await asyncio.sleep(latency.sample())
+
+        if random.random() < self.config.error_rate:
+            self._count("errors")
+            handler.set_status(500)
+            handler.finish({"errors": [{"status": "500", "title": "Internal Server Error"}]})
+            return
+
+        if random.random() < self.config.conflict_rate:
+            self._count("conflicts")
+            handler.set_status(409)
+
+            if self.config.retry_after:
+                handler.set_header("Retry-After", str(self.config.retry_after))
+
+            handler.finish({"errors": [{"status": "409", "title": "Conflict"}]})
+            return
+
+        respond_ok()
+
+    def create_attestation(self, handler, agent_id):
+        index = self._latest_indices.get(agent_id, -1) + 1
+        self._latest_indices[agent_id] = index
+        self._count("created")
+
+        handler.set_status(201)
+        handler.set_header("Location", f"/v3.0/agents/{agent_id}/attestations/{index}")
+        handler.finish({
+            "data": {
+                "type": "attestation",
+                "attributes": {"agent_id": agent_id, "index": index, "stage": "awaiting_evidence"}
+            }
+        })
+
+    def update_attestation(self, handler, agent_id, index):
+        self._count("updated")
+
+        handler.set_status(202)
+        handler.finish({
+            "data": {
+                "type": "attestation",
+                "attributes": {"agent_id": agent_id, "index": int(index), "stage": "evaluating_evidence"}
+            }
+        })
+
+    def make_app(self):
+        verifier = self
+
+        class AttestationsHandler(RequestHandler):
+            async def post(self, agent_id):
+                await verifier.respond(
+                    self, verifier.config.create_latency, lambda: verifier.create_attestation(self, agent_id)
+                )
+
+        class AttestationHandler(RequestHandler):
+            async def patch(self, agent_id, index):
+                await verifier.respond(
+                    self, verifier.config.update_latency, lambda: verifier.update_attestation(self, agent_id, index)
+                )
+
+        return Application([
+            (r"/v3\.0/agents/([^/]+)/attestations/?", AttestationsHandler),
+            (r"/v3\.0/agents/([^/]+)/attestations/([0-9]+)/?", AttestationHandler)
+        ], log_function=lambda _handler: None)
+
+    async def report(self):
+        previous = self._get_totals()
+        previous_time = time.perf_counter()
+
+        while True:
+            await asyncio.sleep(self.report_interval)
+            totals = self._get_totals()
+            now = time.perf_counter()
+            rates = {outcome: (totals[outcome] - previous[outcome]) / (now - previous_time) for outcome in totals}
+            previous, previous_time = totals, now
+
+            total_f = OutputHelpers.format_count(totals["updated"], "attestation", "attestations")
+
+            print(
+                f"Answered {round(rates['created'], 1)} creates/s and {round(rates['updated'], 1)} updates/s, with "
+                f"{round(rates['conflicts'], 1)} conflicts/s and {round(rates['errors'], 1)} errors/s "
+                f"({total_f} in total)",
+                flush=True
+            )
+
+    async def serve(self, sockets):
+        server = HTTPServer(self.make_app(), ssl_options=self._ssl_options)
+        server.add_sockets(sockets)
+
+        if self._process_index() == 0 and self.report_interval:
+            asyncio.create_task(self.report())
+
+        await asyncio.Event().wait()
+
+    def listen(self, address="127.0.0.1"):
+        # Answers requests from within the current event loop on a free port, which is returned, e.g., so that a worker
+        # process can answer its own requests
+        sockets = bind_sockets(0, address)
+        server = HTTPServer(self.make_app(), ssl_options=self._ssl_options)
+        server.add_sockets(sockets)
+        return sockets[0].getsockname()[1]
+
+    def run(self):
+        # The sockets are bound before forking so that all processes accept connections on the same port
+        sockets = bind_sockets(self.port)
+        scheme = "https" if self._ssl_options else "http"
+        processes_f = OutputHelpers.format_count(self.process_count, "process", "processes")
+        print(f"Serving mock push attestation endpoints at {scheme}://0.0.0.0:{self.port} using {processes_f}")
+
+        if self.process_count > 1:
+            fork_processes(self.process_count)
+
+        asyncio.run(self.serve(sockets))
+
+    @property
+    def config(self):
+        return self._config
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def process_count(self):
+        return self._process_count
+
+    @property
+    def report_interval(self):
+        return self._report_interval
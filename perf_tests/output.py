@@ -62,6 +62,17 @@ class OutputHelpers:
         else:
             return f"{round(seconds/3600, 1)}h"
 
+    @staticmethod
+    def format_size(num_bytes):
+        if num_bytes < 1024:
+            return f"{num_bytes}B"
+        elif num_bytes < 1024 ** 2:
+            return f"{round(num_bytes/1024, 1)}KiB"
+        elif num_bytes < 1024 ** 3:
+            return f"{round(num_bytes/1024**2, 1)}MiB"
+        else:
+            return f"{round(num_bytes/1024**3, 1)}GiB"
+
     @staticmethod
     def format_count(number, singular, plural):
         return f"{number} {singular}" if number == 1 else f"{number} {plural}"
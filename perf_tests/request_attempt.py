@@ -19,12 +19,30 @@ import json
 import time
 import traceback
 
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+import pycurl
+
+from tornado.httpclient import HTTPRequest
+from tornado.simple_httpclient import HTTPTimeoutError
 
 from perf_tests.output import OutputHelpers
 
 
 class RequestAttempt:
+    # Causes into which failed requests are classified, other than those which the verifier asked to be retried
+    FAILURE_TYPES = [
+        "timeout", "connection refused", "tls error", "http 3xx", "http 4xx", "http 5xx", "unparseable body", "other"
+    ]
+
+    # Shortest timeout (in seconds) given to a request. Timeouts are passed to libcurl in whole milliseconds, and libcurl
+    # treats a timeout of zero as no timeout at all
+    MIN_TIMEOUT = 0.001
+
+    # libcurl error codes which indicate that the TLS handshake or certificate verification failed
+    TLS_ERRORS = {
+        getattr(pycurl, name) for name in dir(pycurl)
+        if name.startswith("E_SSL_") or name in ["E_PEER_FAILED_VERIFICATION", "E_USE_SSL_FAILED"]
+    }
+
     def __init__(self, task, method, url):
         self._task = task
 
@@ -66,6 +84,10 @@ class RequestAttempt:
         self._log_info(f"{self._method} {self._url}")
 
     def _log_outcome(self):
+        # Logging every request costs the workers CPU time and terminal I/O, so it is only done when requested
+        if not self.task.task_manager.execution.log_requests:
+            return
+
         operation = f"{self.action} attestation {self.task.index} for {self.task.agent.id}"
 
         if self.ok:
@@ -80,7 +102,7 @@ class RequestAttempt:
             else:
                 issue = "performed too early"
 
-            self._log_retry(f"{operation} {issue}, retrying in {retry_after_f}")
+            self._log_retry(f"{operation} {issue}, verifier asked to retry after {retry_after_f}")
             return
 
         if self.exception:
@@ -98,17 +120,23 @@ class RequestAttempt:
         else:
             details = "An unknown error occurred"
 
-        self._log_fail(f"{operation} failed after {OutputHelpers.format_duration(self.duration)}", details)
+        duration_f = OutputHelpers.format_duration(self.duration)
+        self._log_fail(f"{operation} failed ({self.failure}) after {duration_f}", details)
 
     def _curl_set_opts(self, curl_obj):
         curl_obj.setopt(curl_obj.SSL_VERIFYPEER, False)
         curl_obj.setopt(curl_obj.SSL_VERIFYHOST, False)
+        curl_obj.setopt(curl_obj.TCP_KEEPALIVE, 1)
 
     def set_header(self, name, value):
         self._req_headers[name] = value
 
     def set_body(self, req_body):
-        if isinstance(req_body, (dict, list)):
+        # Bytes are expected to contain JSON which has already been serialised, e.g., by EvidencePayloads
+        if isinstance(req_body, bytes):
+            self.set_header("Content-Type", "application/json")
+            self._req_body = req_body
+        elif isinstance(req_body, (dict, list)):
             self.set_header("Content-Type", "application/json")
             self._req_body = json.dumps(req_body)
         else:
@@ -118,16 +146,23 @@ class RequestAttempt:
     async def perform(self):
         self._log_request()
 
-        AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient")
-        http_client = AsyncHTTPClient()
+        execution = self.task.task_manager.execution
+        http_client = self.task.task_manager.http_client
+
+        # A request may not outlast the deadline of its attestation, if there is one
+        request_timeout = execution.request_timeout
+        remaining_time = self.task.remaining_time
+
+        if remaining_time is not None:
+            request_timeout = max(min(request_timeout, remaining_time), self.MIN_TIMEOUT)
 
         self._request = HTTPRequest(
             url = self._url,
             method = self._method,
             headers = self._req_headers,
             body = self._req_body,
-            connect_timeout = 20,
-            request_timeout = 45,
+            connect_timeout = min(execution.connect_timeout, request_timeout),
+            request_timeout = request_timeout,
             prepare_curl_callback = self._curl_set_opts
         )
 
@@ -150,9 +185,12 @@ class RequestAttempt:
             "start_time": self.start_time,
             "end_time": self.end_time,
             "duration": self.duration,
+            "queue_time": self.queue_time,
+            "timings": self.timings,
             "ok": self.ok,
             "conflicts": self.conflicts,
-            "retry_after": self.retry_after
+            "retry_after": self.retry_after,
+            "failure": self.failure
         }
 
     @property
@@ -190,7 +228,53 @@ class RequestAttempt:
             return self.end_time - self.start_time
 
         return self.response.request_time
+
+    @property
+    def queue_time(self):
+        # Time spent waiting for a free connection in the worker's HTTP client, which is excluded from the duration
+        if not self.response or not self.response.time_info:
+            return None
+
+        return self.response.time_info.get("queue")
     
+    @property
+    def timings(self):
+        # Times reported by libcurl at which each stage of the request was reached, relative to the start of the request
+        if not self.response or not self.response.time_info:
+            return None
+
+        return {
+            "namelookup": self.response.time_info.get("namelookup"),
+            "connect": self.response.time_info.get("connect"),
+            "appconnect": self.response.time_info.get("appconnect"),
+            "pretransfer": self.response.time_info.get("pretransfer"),
+            "starttransfer": self.response.time_info.get("starttransfer"),
+            "total": self.response.time_info.get("total")
+        }
+
+    @property
+    def phase_durations(self):
+        timings = self.timings
+
+        if not timings or not timings["total"]:
+            return None
+
+        # libcurl reports zero for any stage which was not reached or was skipped, e.g., when an existing connection is
+        # reused, in which case the stage is treated as taking no time
+        namelookup = timings["namelookup"] or 0.0
+        connect = timings["connect"] or namelookup
+        appconnect = timings["appconnect"] or connect
+        pretransfer = timings["pretransfer"] or appconnect
+        starttransfer = timings["starttransfer"] or timings["total"]
+
+        return {
+            "dns": namelookup,
+            "tcp": max(connect - namelookup, 0.0),
+            "tls": max(appconnect - connect, 0.0),
+            "wait": max(starttransfer - pretransfer, 0.0),
+            "receive": max(timings["total"] - starttransfer, 0.0)
+        }
+
     @property
     def request(self):
         return self._request
@@ -271,6 +355,38 @@ class RequestAttempt:
 
         return retry_after
 
+    @property
+    def failure(self):
+        # Returns the cause of a failed request, as one of FAILURE_TYPES, or None if the request did not fail
+        if self.ok or self.retry_after or (not self.response and not self.exception):
+            return None
+
+        error = self.exception or self.response.error
+        curl_errno = getattr(error, "errno", None)
+
+        # Requests which time out while queued behind max_clients other requests never reach libcurl, so they fail
+        # with an HTTPTimeoutError instead of a libcurl error
+        if curl_errno == pycurl.E_OPERATION_TIMEDOUT or isinstance(error, HTTPTimeoutError):
+            return "timeout"
+
+        if curl_errno == pycurl.E_COULDNT_CONNECT:
+            return "connection refused"
+
+        if curl_errno in self.TLS_ERRORS:
+            return "tls error"
+
+        # Responses with a code of 599 were not received from the verifier but stand in for other errors
+        if self.exception or not self.response.code or self.response.code == 599:
+            return "other"
+
+        if 300 <= self.response.code <= 599:
+            return f"http {self.response.code // 100}xx"
+
+        if 200 <= self.response.code <= 299:
+            return "unparseable body"
+
+        return "other"
+
 
 class DeserializedAttempt(RequestAttempt):
     def __init__(self, task, data):
@@ -288,14 +404,26 @@ class DeserializedAttempt(RequestAttempt):
         self._exception = None
 
         self._duration = data["duration"]
+        self._queue_time = data.get("queue_time")
+        self._timings = data.get("timings")
         self._ok = data["ok"]
         self._conflicts = data["conflicts"]
         self._retry_after = data["retry_after"]
+        # Results saved before failures were classified do not record their cause
+        self._failure = data.get("failure", "other" if not self._ok and not self._retry_after else None)
 
     @property
     def duration(self):
         return self._duration
 
+    @property
+    def queue_time(self):
+        return self._queue_time
+
+    @property
+    def timings(self):
+        return self._timings
+
     @property
     def ok(self):
         return self._ok
@@ -308,4 +436,8 @@ class DeserializedAttempt(RequestAttempt):
     def retry_after(self):
         return self._retry_after
 
+    @property
+    def failure(self):
+        return self._failure
+
     
\ No newline at end of file
@@ -0,0 +1,224 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Value
+
+from perf_tests.columnar_results import ColumnarResults
+from perf_tests.stats import GlobalStats, TimelineStats
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Computes statistics for one or more past test runs. Results saved as JSON lines are split into chunks which are read
+# in parallel by a pool of processes, one task at a time, with each process recording into its own shard of the shared
+# statistics. Memory usage therefore depends on the no. of processes rather than the size of the results. Columnar
+# results are instead loaded in full and, when NumPy is installed, recorded straight from their columns.
+#
+# When the results of several hosts are given, each host's times are converted to wall-clock time using the anchor in
+# the header of its results, so that they are placed on a common timeline, and the statistics of each host are also
+# kept separately
+class ResultAggregator:
+    # Default size (in bytes) of the chunks which are handed to each process
+    CHUNK_SIZE = 32 * 1024 * 1024
+
+    def __init__(self, serializers, interval, worker_count=None, chunk_size=None):
+        self._serializers = serializers if isinstance(serializers, list) else [serializers]
+        self._interval = interval
+        self._worker_count = worker_count or os.cpu_count()
+        self._chunk_size = chunk_size or self.CHUNK_SIZE
+        self._task_count = 0
+        self._host_stats = []
+
+    def _make_stats(self, shard_count, earliest, latest):
+        # The timeline covers the whole run, as all results are available up front. So that the memory it needs does not
+        # grow with the length of the run, long runs use a multiple of the requested interval instead of more windows
+        origin = earliest if earliest is not None else 0.0
+        latest = latest if latest is not None else origin
+        interval_count = math.ceil((latest - origin) / self.interval) + 1
+        interval = self.interval * math.ceil(interval_count / TimelineStats.WINDOW_COUNT)
+        window_count = math.ceil((latest - origin) / interval) + 1
+
+        return GlobalStats(shard_count, interval, origin, window_count)
+
+    def get_offsets(self):
+        # Returns the time, worker and agent offsets of each set of results, numbering the workers and agents of each
+        # host after those of the hosts before it
+        offsets = []
+        worker_offset = 0
+        agent_offset = 0
+
+        for serializer in self.serializers:
+            header = serializer.header
+            offsets.append((serializer.time_offset, worker_offset, agent_offset))
+            worker_offset += header.get("worker_count", 0)
+            agent_offset += header.get("agent_count", 0)
+
+        return offsets
+
+    def _aggregate_in_memory(self):
+        results = []
+
+        for serializer, (time_offset, _, _) in zip(self.serializers, self.get_offsets()):
+            # Building an object for every task and attempt takes far longer than recording the columns directly
+            if numpy is not None and ColumnarResults.is_columnar(serializer.file_path):
+                source = ColumnarResults(serializer.file_path).load()
+                start_time, end_time = source.get_time_range()
+            else:
+                source = serializer.read_tasks()
+                start_time = min([task.start_time for task in source if task.start_time], default=None)
+                end_time = max([task.end_time for task in source if task.end_time], default=None)
+
+            results.append((
+                source,
+                start_time + time_offset if start_time is not None else None,
+                end_time + time_offset if end_time is not None else None
+            ))
+
+        earliest = min([earliest for _, earliest, _ in results if earliest is not None], default=None)
+        latest = max([latest for _, _, latest in results if latest is not None], default=None)
+        stats = self._make_stats(1, earliest, latest)
+        self._host_stats = [self._make_stats(1, earliest, latest) for _ in results] if len(results) > 1 else []
+        self._task_count = 0
+
+        for i, ((source, _, _), offsets) in enumerate(zip(results, self.get_offsets())):
+            if isinstance(source, ColumnarResults):
+                source.record_stats(stats, *offsets)
+
+                if self._host_stats:
+                    source.record_stats(self._host_stats[i], offsets[0])
+
+                self._task_count += source.task_count
+                continue
+
+            for task in source:
+                stats.record_task(task, *offsets)
+
+                if self._host_stats:
+                    self._host_stats[i].record_task(task, offsets[0])
+
+            self._task_count += len(source)
+
+        return stats
+
+    def aggregate(self, in_memory=False):
+        # Columnar results are compact enough to be loaded in full
+        if in_memory or any(ColumnarResults.is_columnar(serializer.file_path) for serializer in self.serializers):
+            return self._aggregate_in_memory()
+
+        chunks = [
+            (i, start, end)
+            for i, serializer in enumerate(self.serializers)
+            for start, end in serializer.get_chunks(self.chunk_size)
+        ]
+
+        worker_count = max(min(self.worker_count, len(chunks)), 1)
+        offsets = self.get_offsets()
+
+        with ProcessPoolExecutor(worker_count) as executor:
+            time_ranges = list(executor.map(_get_time_range, [self.serializers] * len(chunks), chunks))
+
+        # Convert the time range of each chunk to the common clock
+        time_ranges = [
+            tuple(t + offsets[i][0] if t is not None else None for t in time_range)
+            for (i, _, _), time_range in zip(chunks, time_ranges)
+        ]
+
+        earliest = min([earliest for earliest, _ in time_ranges if earliest is not None], default=None)
+        latest = max([latest for _, latest in time_ranges if latest is not None], default=None)
+
+        # The statistics must be allocated before the processes are started so that they are shared with them
+        stats = self._make_stats(worker_count, earliest, latest)
+        self._host_stats = []
+
+        if len(self.serializers) > 1:
+            self._host_stats = [self._make_stats(worker_count, earliest, latest) for _ in self.serializers]
+
+        shard_counter = Value(ctypes.c_int, 0)
+        initargs = (self.serializers, offsets, stats, self._host_stats, shard_counter)
+
+        with ProcessPoolExecutor(worker_count, initializer=_set_global, initargs=initargs) as executor:
+            self._task_count = sum(executor.map(_record_chunk, chunks))
+
+        return stats
+
+    @property
+    def serializers(self):
+        return self._serializers.copy()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def worker_count(self):
+        return self._worker_count
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @property
+    def task_count(self):
+        return self._task_count
+
+    @property
+    def host_stats(self):
+        # Pairs of host names and their statistics, only available once results from several hosts are aggregated
+        return [(serializer.host, stats) for serializer, stats in zip(self.serializers, self._host_stats)]
+
+
+def _set_global(serializers, offsets, stats, host_stats, shard_counter):
+    global _serializers
+    global _offsets
+    global _stats
+    global _host_stats
+    _serializers = serializers
+    _offsets = offsets
+    _stats = stats
+    _host_stats = host_stats
+
+    # Claim a shard of the statistics which is not used by any other process in the pool
+    with shard_counter.get_lock():
+        GlobalStats.use_shard(shard_counter.value)
+        shard_counter.value += 1
+
+def _get_time_range(serializers, chunk):
+    serializer_index, start, end = chunk
+    return serializers[serializer_index].get_time_range(start, end)
+
+def _record_chunk(chunk):
+    serializer_index, start, end = chunk
+    offsets = _offsets[serializer_index]
+    task_count = 0
+
+    for task in _serializers[serializer_index].iter_tasks(start, end):
+        _stats.record_task(task, *offsets)
+
+        if _host_stats:
+            _host_stats[serializer_index].record_task(task, offsets[0])
+
+        task_count += 1
+
+    return task_count
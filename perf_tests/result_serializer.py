@@ -16,14 +16,33 @@
 # under the License.
 
 import json
+import os
+import queue
+import re
+import signal
+import socket
+import time
 
 from datetime import datetime
+from multiprocessing import Process, Queue
 from pathlib import Path
 
 from perf_tests.attestation_task import DeserializedTask
+from perf_tests.columnar_results import ColumnarResults
 
 
+# Results are written by a single writer process, to which each worker sends batches of serialised tasks over a queue,
+# so that writes from different workers cannot be interleaved and the file is only opened once. The writer buffers
+# what it receives and writes it out once enough has accumulated or enough time has passed
 class ResultSerializer:
+    # Max. no. of tasks which a worker serialises before sending them to the writer
+    BATCH_SIZE = 256
+    # Max. no. of batches waiting to be written, after which workers wait for the writer to catch up
+    QUEUE_SIZE = 1024
+    # Size of the writer's buffer (in bytes) and max. time (in seconds) that results can be held before being written
+    FLUSH_SIZE = 1024 * 1024
+    FLUSH_INTERVAL = 1
+
     def __init__(self, file_path=None):
         if not file_path:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -31,48 +50,220 @@ class ResultSerializer:
             directory.mkdir(exist_ok=True)
             file_path = directory.joinpath(timestamp).with_suffix(".jsonl")
         else:
+            # Accept a path or a timestamp, with or without the suffix of either results format
             file_path = Path(file_path)
+            candidates = []
 
-            if not file_path.is_file():
-                file_path = Path("results").joinpath(file_path)
+            for directory_path in [file_path, Path("results").joinpath(file_path)]:
+                candidates.append(directory_path)
+                candidates.append(directory_path.with_suffix(".jsonl"))
+                candidates.append(directory_path.with_suffix(ColumnarResults.SUFFIX))
 
-            if not file_path.is_file():
-                file_path = Path(file_path).with_suffix(".jsonl")
+            file_path = next((candidate for candidate in candidates if candidate.is_file()), candidates[-2])
 
         self._file_path = file_path
-        self._queued_tasks = set()
+        self._queued_lines = []
+        self._queue = None
+        self._writer = None
+        self._header = None
+
+    def _run_writer(self, header):
+        # The writer is stopped by the parent process once all workers have finished, not by Ctrl+C
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        buffer = [json.dumps(header, separators=(",", ":")) + "\n"]
+        buffer_size = 0
+        next_flush = time.monotonic() + self.FLUSH_INTERVAL
+
+        with open(self.file_path, "a", buffering=self.FLUSH_SIZE) as f:
+            while True:
+                try:
+                    batch = self._queue.get(timeout=max(next_flush - time.monotonic(), 0))
+                except queue.Empty:
+                    batch = ""
+
+                if batch is None:
+                    break
+
+                buffer.append(batch)
+                buffer_size += len(batch)
+
+                if buffer_size >= self.FLUSH_SIZE or time.monotonic() >= next_flush:
+                    f.write("".join(buffer))
+                    f.flush()
+                    buffer = []
+                    buffer_size = 0
+                    next_flush = time.monotonic() + self.FLUSH_INTERVAL
+
+            f.write("".join(buffer))
+
+    def start_writer(self, details=None):
+        # The results start with a header which records the wall-clock time at a known value of the performance counter
+        # used to time requests, so that results from different hosts can later be placed on a common timeline
+        header = {
+            "type": "header",
+            "version": 1,
+            "host": socket.gethostname(),
+            "wall_time": time.time(),
+            "perf_counter": time.perf_counter(),
+            **(details or {})
+        }
+
+        # Must be called before the worker processes are started so that they inherit the queue
+        self._queue = Queue(self.QUEUE_SIZE)
+        self._writer = Process(target=self._run_writer, args=(header,))
+        self._writer.start()
+
+    def stop_writer(self):
+        if not self._writer:
+            return
+
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
 
     def queue_task(self, task):
-        self._queued_tasks.add(task)
+        # Tasks are serialised straight away so that they do not need to be kept in memory until they are written
+        self._queued_lines.append(json.dumps(task.render(), separators=(",", ":")) + "\n")
+
+        if len(self._queued_lines) >= self.BATCH_SIZE:
+            self.write_tasks()
+
+    def write_record(self, record):
+        # Writes a record other than a task, e.g., a sample of database activity, which is identified by its type. The
+        # type must be the first key so that records can be told apart from tasks without parsing every line
+        self._queued_lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        self.write_tasks()
 
     def write_tasks(self):
+        if not self._queued_lines:
+            return
+
+        batch = "".join(self._queued_lines)
+        self._queued_lines = []
+
+        if self._queue:
+            self._queue.put(batch)
+            return
+
+        # When there is no writer process, e.g., when only a single process is in use, write the tasks directly
         with open(self.file_path, "a") as f:
-            for task in self.queued_tasks:
-                serialized_task = json.dumps(task.render())
-                f.write(serialized_task + "\n")
-                self._queued_tasks.remove(task)
+            f.write(batch)
+
+    def get_chunks(self, chunk_size):
+        # Splits the file into byte ranges of roughly the given size, each ending at the end of a line, so that they can
+        # be read independently of each other
+        file_size = os.path.getsize(self.file_path)
+        chunks = []
+        start = 0
+
+        with open(self.file_path, "rb") as f:
+            while start < file_size:
+                f.seek(min(start + chunk_size, file_size))
+                f.readline()
+                end = min(f.tell(), file_size)
+                chunks.append((start, end))
+                start = end
+
+        return chunks
+
+    def iter_tasks(self, start=0, end=None):
+        # Reads the tasks within the given byte range one at a time, so that they do not all need to be kept in memory
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+
+            while end is None or f.tell() < end:
+                line = f.readline()
+
+                if not line:
+                    break
+
+                if not line.strip():
+                    continue
+
+                data = json.loads(line)
+
+                if "type" not in data:
+                    yield DeserializedTask(data)
+
+    def get_time_range(self, start=0, end=None):
+        # Finds the earliest and latest request times within the given byte range without parsing each task in full
+        pattern = re.compile(rb'"(start|end)_time":\s*(-?[0-9][0-9.eE+-]*)')
+        earliest = None
+        latest = None
+
+        with open(self.file_path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start if end is not None else -1)
+
+        for match in pattern.finditer(data):
+            value = float(match.group(2))
+
+            if match.group(1) == b"start":
+                earliest = value if earliest is None else min(earliest, value)
+            else:
+                latest = value if latest is None else max(latest, value)
+
+        return earliest, latest
 
     def read_tasks(self):
         if not self.file_path.is_file():
             raise ValueError(f"no file exists at {self.file_path}")
 
+        if ColumnarResults.is_columnar(self.file_path):
+            return ColumnarResults(self.file_path).get_tasks()
+
         tasks = []
 
         with open(self.file_path, "r") as f:
             for line in f:
                 task_data = json.loads(line)
-                tasks.append(DeserializedTask(task_data))
+
+                if "type" not in task_data:
+                    tasks.append(DeserializedTask(task_data))
 
         return tasks
-    
+
+    def read_records(self, record_type):
+        # Returns the records of the given type which were saved alongside the tasks
+        if ColumnarResults.is_columnar(self.file_path):
+            records = self.header.get("records", [])
+        else:
+            with open(self.file_path, "r") as f:
+                records = [json.loads(line) for line in f if line.startswith('{"type":')]
+
+        return [record for record in records if record.get("type") == record_type]
+
     @property
     def file_path(self):
         return self._file_path
 
     @property
-    def queued_tasks(self):
-        return self._queued_tasks.copy()
+    def header(self):
+        # Results saved before headers were introduced have no header, in which case an empty one is returned
+        if self._header is None:
+            if ColumnarResults.is_columnar(self.file_path):
+                self._header = ColumnarResults(self.file_path).header
+            else:
+                with open(self.file_path, "r") as f:
+                    data = json.loads(f.readline() or "{}")
 
+                self._header = data if data.get("type") == "header" else {}
 
+        return self._header.copy()
 
+    @property
+    def host(self):
+        return self.header.get("host") or self.file_path.stem
+
+    @property
+    def time_offset(self):
+        # Difference between the wall-clock time and the performance counter used to time requests on the host
+        if "wall_time" not in self.header:
+            return 0.0
 
+        return self.header["wall_time"] - self.header["perf_counter"]
+
+    @property
+    def queued_task_count(self):
+        return len(self._queued_lines)
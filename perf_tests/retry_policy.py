@@ -0,0 +1,113 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+import random
+
+from multiprocessing import RawArray
+
+
+# Decides whether and when to retry a request which the verifier asked to be retried, i.e., which conflicted with an
+# attestation already in progress or was answered with a Retry-After header. Delays grow exponentially with each retry
+# of the same request, up to a cap, and are randomised ("full jitter") so that agents which conflicted at the same time
+# do not all retry at the same time. When Retry-After is honoured, the jittered delay is added to the time the verifier
+# asked for, so that no retry is sent earlier than requested.
+#
+# Retries can be limited per request, by the no. of attempts, and across all workers, by a budget given as the max.
+# share of all requests which may be retries. Each worker counts its requests in its own element of the shared counts,
+# so no lock is needed, and the budget is checked against the sum of all workers' counts
+class RetryPolicy:
+    JITTER_MODES = ["full", "none"]
+    RETRY_AFTER_MODES = ["honour", "override"]
+    # No. of retries always allowed by the budget, so that a few conflicts at the start of a run are not refused
+    BUDGET_MIN_RETRIES = 100
+    # Largest exponent used to compute the backoff, beyond which the cap is always reached in practice
+    MAX_EXPONENT = 32
+
+    def __init__(
+        self, worker_count=1, base_delay=1.0, max_delay=30.0, max_attempts=0, budget=0.0, jitter="full",
+        retry_after="honour"
+    ):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_attempts = max_attempts
+        self._budget = budget
+        self._jitter = jitter
+        self._retry_after = retry_after
+        self._requests = RawArray(ctypes.c_long, worker_count)
+        self._retries = RawArray(ctypes.c_long, worker_count)
+
+    def record_attempt(self, worker_index, retry):
+        self._requests[worker_index] += 1
+
+        if retry:
+            self._retries[worker_index] += 1
+
+    def allow_retry(self, attempt_count):
+        # Returns whether a request which has been attempted the given no. of times may be retried
+        if self.max_attempts and attempt_count >= self.max_attempts:
+            return False
+
+        if self.budget:
+            return self.retry_count < self.budget * self.request_count + self.BUDGET_MIN_RETRIES
+
+        return True
+
+    def get_delay(self, retry_after, retry_index):
+        # Returns the time to wait before the given retry of a request, counting from zero, where retry_after is the
+        # no. of seconds which the verifier asked to wait
+        backoff = min(self.max_delay, self.base_delay * 2 ** min(retry_index, self.MAX_EXPONENT))
+
+        if self.jitter == "full":
+            backoff = random.uniform(0, backoff)
+
+        if self.retry_after == "honour":
+            return (retry_after or 0) + backoff
+
+        return backoff
+
+    @property
+    def base_delay(self):
+        return self._base_delay
+
+    @property
+    def max_delay(self):
+        return self._max_delay
+
+    @property
+    def max_attempts(self):
+        return self._max_attempts
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @property
+    def jitter(self):
+        return self._jitter
+
+    @property
+    def retry_after(self):
+        return self._retry_after
+
+    @property
+    def request_count(self):
+        return sum(self._requests)
+
+    @property
+    def retry_count(self):
+        return sum(self._retries)
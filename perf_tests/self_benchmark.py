@@ -0,0 +1,181 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import asyncio
+import time
+
+from perf_tests.output import OutputHelpers, Table, ColumnGroup
+from perf_tests.stage_sampler import StageSampler
+
+
+# Measures the cost of the tools themselves by running the usual scheduling and attestation pipeline of each worker
+# against a verifier which answers immediately from within the same process. The CPU time of each worker is divided
+# between the stages of the pipeline using a StageSampler, and the time spent answering requests is then discounted,
+# as it would be spent by the verifier in a real test, to estimate the max. rate at which each worker could perform
+# attestations if the verifier were never the bottleneck
+class SelfBenchmark:
+    RESPONDER_STAGE = "loopback responder"
+    # Time (in seconds) between checks for the end of the measured window
+    POLL_INTERVAL = 0.01
+
+    @classmethod
+    async def measure(cls, worker_index, task_manager, coroutine):
+        # Awaits the given coroutine, which should perform the worker's attestations, and returns its measurements. These
+        # cover a single window which ends as soon as new tasks are no longer allowed, so that the attestations still in
+        # progress at that point, and the time spent waiting for them, are not counted
+        sampler = StageSampler()
+        sampler.start()
+        start_concluded = task_manager.worker_concluded_count
+        # Only the CPU time of the event loop's thread is measured, as that of the process would include the sampler
+        start_cpu_time = time.thread_time()
+        start_time = time.perf_counter()
+        run = asyncio.ensure_future(coroutine)
+
+        while task_manager.new_tasks_allowed and not run.done():
+            await asyncio.sleep(cls.POLL_INTERVAL)
+
+        measurements = {
+            "worker_index": worker_index,
+            "attestations": task_manager.worker_concluded_count - start_concluded,
+            "cpu_time": time.thread_time() - start_cpu_time,
+            "wall_time": time.perf_counter() - start_time,
+            "stage_samples": sampler.counts
+        }
+
+        sampler.stop()
+        await run
+        return measurements
+
+    @classmethod
+    def _get_busy_samples(cls, stage_samples):
+        return {stage: count for stage, count in stage_samples.items() if stage != StageSampler.IDLE}
+
+    @classmethod
+    def get_client_cpu_time(cls, result):
+        # CPU time of the worker excluding that spent answering its own requests
+        busy_samples = cls._get_busy_samples(result["stage_samples"])
+        busy_count = sum(busy_samples.values())
+        responder_share = busy_samples.get(cls.RESPONDER_STAGE, 0) / busy_count if busy_count else 0.0
+        return result["cpu_time"] * (1 - responder_share)
+
+    @classmethod
+    def make_worker_table(cls, results):
+        table = (
+            Table("<8", ">9", ">8", ">7", ">10", ">11")
+            .head("worker", "attests", "att/s", "cpu", "cpu/att", "max att/s")
+        )
+
+        totals = {
+            "attestations": 0, "cpu_time": 0.0, "wall_time": 0.0, "client_cpu_time": 0.0, "rate": 0.0, "max_rate": 0.0
+        }
+
+        for result in sorted(results, key=lambda r: r["worker_index"]):
+            attestations = result["attestations"]
+            client_cpu_time = cls.get_client_cpu_time(result)
+            totals["attestations"] += attestations
+            totals["cpu_time"] += result["cpu_time"]
+            totals["wall_time"] += result["wall_time"]
+            totals["client_cpu_time"] += client_cpu_time
+            totals["rate"] += attestations / result["wall_time"] if result["wall_time"] else 0.0
+            totals["max_rate"] += attestations / client_cpu_time if client_cpu_time else 0.0
+
+            table = table.row(
+                result["worker_index"],
+                attestations,
+                f"{round(attestations / result['wall_time'], 1)}" if result["wall_time"] else "--",
+                f"{round(result['cpu_time'] / result['wall_time'] * 100, 1)}%" if result["wall_time"] else "--",
+                OutputHelpers.format_duration(client_cpu_time / attestations) if attestations else "--",
+                f"{round(attestations / client_cpu_time, 1)}" if client_cpu_time else "--"
+            )
+
+        attestations = totals["attestations"]
+        client_cpu_time = totals["client_cpu_time"]
+
+        return table.row("").row(
+            "total",
+            attestations,
+            f"{round(totals['rate'], 1)}",
+            f"{round(totals['cpu_time'] / totals['wall_time'] * 100, 1)}%" if totals["wall_time"] else "--",
+            OutputHelpers.format_duration(client_cpu_time / attestations) if attestations else "--",
+            f"{round(totals['max_rate'], 1)}" if client_cpu_time else "--"
+        )
+
+    @classmethod
+    def make_stage_table(cls, results):
+        # Stages are listed by their share of the time in which the workers were busy, with the CPU time per attestation
+        # attributed to each stage in proportion
+        stage_samples = {}
+
+        for result in results:
+            for stage, count in result["stage_samples"].items():
+                stage_samples[stage] = stage_samples.get(stage, 0) + count
+
+        busy_samples = cls._get_busy_samples(stage_samples)
+        busy_count = sum(busy_samples.values())
+        attestations = sum(result["attestations"] for result in results)
+        cpu_time = sum(result["cpu_time"] for result in results)
+
+        table = (
+            Table("<24", ">8", ">10")
+            .head("stage", "busy", "cpu/att")
+        )
+
+        for stage, count in sorted(busy_samples.items(), key=lambda item: item[1], reverse=True):
+            share = count / busy_count
+            stage_cpu_time = cpu_time * share / attestations if attestations else None
+
+            table = table.row(
+                stage,
+                f"{round(share * 100, 1)}%",
+                OutputHelpers.format_duration(stage_cpu_time) if stage_cpu_time is not None else "--"
+            )
+
+        idle_count = stage_samples.get(StageSampler.IDLE, 0)
+        all_count = busy_count + idle_count
+
+        if all_count:
+            table = table.row("").row(StageSampler.IDLE, f"{round(idle_count / all_count * 100, 1)}%*", "")
+
+        return table
+
+    @classmethod
+    def print_report(cls, results):
+        print("\n")
+        print("\u001b[40;1m" + ("─" * 105) + "\u001b[0m")
+        print("\u001b[40;1m" + OutputHelpers.center("SELF-BENCHMARK SUMMARY", 105) + "\u001b[0m")
+        print("\u001b[40;1m" + ("═" * 105) + "\u001b[0m")
+        print("")
+
+        worker_group = (
+            ColumnGroup()
+            .set_title("Attestations per Worker", "^")
+            .add(OutputHelpers.center(cls.make_worker_table(results).output, 70))
+        )
+
+        stage_group = (
+            ColumnGroup()
+            .set_title("Time Spent in Each Stage", "^")
+            .add(OutputHelpers.center(cls.make_stage_table(results).output, 70))
+        )
+
+        print(OutputHelpers.center(worker_group.get_output(), 103))
+        print(OutputHelpers.center(stage_group.get_output(), 103))
+
+        print("  'max att/s' is the rate each worker could sustain if it spent all of its CPU time performing "
+              "attestations,\n  excluding the time spent answering its own requests, which a real verifier would "
+              "spend instead")
+        print("  * Share of all samples, including those taken while the worker waited for I/O\n")
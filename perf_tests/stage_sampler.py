@@ -0,0 +1,125 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import sys
+import threading
+
+
+# Samples the stack of a worker's main thread at a regular interval from a background thread and attributes each sample
+# to a stage of the attestation pipeline, giving the share of the worker's time spent in each stage at a far lower cost
+# than tracing every function call. Each frame of the stack is checked against the rules in order, starting from the
+# innermost, so that time spent in the standard library or C extensions is attributed to the code which called it
+class StageSampler:
+    INTERVAL = 0.002
+    IDLE = "waiting for I/O"
+    OTHER = "other"
+
+    # Rules which map a frame to a stage, given as the end of the path of a source file (or, ending in "/", a directory
+    # which contains it), the names of the matching functions (or None for any) and the stage
+    RULES = [
+        ("selectors.py", ["select"], IDLE),
+        ("mock_verifier.py", None, "loopback responder"),
+        ("tornado/web.py", None, "loopback responder"),
+        ("tornado/httpserver.py", None, "loopback responder"),
+        ("tornado/http1connection.py", None, "loopback responder"),
+        ("tornado/routing.py", None, "loopback responder"),
+        ("tornado/iostream.py", None, "loopback responder"),
+        ("request_attempt.py", ["_log", "_log_info", "_log_ok", "_log_retry", "_log_fail", "_log_request",
+                                "_log_outcome"], "request logging"),
+        ("request_attempt.py", ["set_body", "set_header"], "request bodies"),
+        ("mock_evidence.py", None, "request bodies"),
+        ("attestation_task.py", ["render"], "results serialisation"),
+        ("request_attempt.py", ["render"], "results serialisation"),
+        ("result_serializer.py", None, "results serialisation"),
+        ("stats.py", None, "statistics"),
+        ("curl_httpclient.py", None, "HTTP client"),
+        ("tornado/httpclient.py", None, "HTTP client"),
+        ("request_attempt.py", None, "attempt bookkeeping"),
+        ("attestation_task.py", None, "attempt bookkeeping"),
+        ("task_manager.py", None, "scheduling"),
+        ("agent.py", None, "scheduling"),
+        ("agent_leases.py", None, "scheduling"),
+        ("run_perf_tests", None, "scheduling"),
+        ("asyncio/", None, "event loop"),
+        ("tornado/", None, "event loop")
+    ]
+
+    def __init__(self, thread_id=None, interval=None):
+        self._thread_id = thread_id or threading.get_ident()
+        self._interval = interval or self.INTERVAL
+        self._counts = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stage_cache = {}
+
+    @classmethod
+    def _match(cls, filename, function):
+        path = filename.replace(os.sep, "/")
+
+        for rule_path, rule_functions, stage in cls.RULES:
+            if rule_path.endswith("/"):
+                matched = f"/{rule_path}" in path
+            else:
+                matched = path.endswith(f"/{rule_path}")
+
+            if matched and (rule_functions is None or function in rule_functions):
+                return stage
+
+        return None
+
+    def classify(self, frame):
+        while frame:
+            code = frame.f_code
+            key = (code.co_filename, code.co_name)
+
+            # Rules are only evaluated once for each function
+            if key not in self._stage_cache:
+                self._stage_cache[key] = self._match(*key)
+
+            if self._stage_cache[key]:
+                return self._stage_cache[key]
+
+            frame = frame.f_back
+
+        return self.OTHER
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+
+            if frame is None:
+                continue
+
+            stage = self.classify(frame)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def counts(self):
+        return self._counts.copy()
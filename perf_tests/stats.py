@@ -16,68 +16,97 @@
 # under the License.
 
 import ctypes
+import math
 import time
 import datetime
 
-from multiprocessing import Value
+from multiprocessing import RawArray
 
 from perf_tests.output import OutputHelpers, Table, ColumnGroup
+from perf_tests.request_attempt import RequestAttempt
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+
+# Percentiles shown in each table of durations, in addition to the average, shortest and longest durations
+PERCENTILES = [("p50", 50), ("p90", 90), ("p99", 99), ("p99.9", 99.9)]
+
+
+# Each worker process records into its own shard of the shared statistics, so that recording never contends on a lock
+# held by another worker. The shards are only merged when the statistics are read
 class GlobalStats:
-    def __init__(self):
-        self._create_requests = RequestStats()
-        self._create_phases = ProtocolStats()
-        self._update_requests = RequestStats()
-        self._update_phases = ProtocolStats()
-        self._full_protocol_runs = ProtocolStats()
-
-        self._start_time = Value(ctypes.c_double, 0.0)
-        self._end_time = Value(ctypes.c_double, 0.0)
-        self._worker_count = Value(ctypes.c_int, 0)
-        self._agent_count = Value(ctypes.c_int, 0)
+    def __init__(self, shard_count=1, interval=10, origin=None, window_count=None):
+        self._create_requests = RequestStats(shard_count)
+        self._create_phases = ProtocolStats(shard_count)
+        self._update_requests = RequestStats(shard_count)
+        self._update_phases = ProtocolStats(shard_count)
+        self._create_timings = PhaseTimingStats(shard_count)
+        self._update_timings = PhaseTimingStats(shard_count)
+        self._full_protocol_runs = ProtocolStats(shard_count)
+        self._scheduled_runs = ProtocolStats(shard_count)
+        self._missed_slots = ShardedValue(shard_count)
+        self._agent_idle = StatCounter(shard_count)
+        self._queue_waits = StatCounter(shard_count)
+        self._retries = RetryStats(shard_count)
+        self._failures = FailureStats(shard_count)
+        self._timeline = TimelineStats(shard_count, interval, origin, window_count)
+
+        self._start_time = ShardedValue(shard_count, "min")
+        self._end_time = ShardedValue(shard_count, "max")
+        self._worker_count = ShardedValue(shard_count, "max")
+        self._agent_count = ShardedValue(shard_count, "max")
+
+    @staticmethod
+    def use_shard(shard_index):
+        # Selects the shard which the current process records into, which must be unique to the process
+        ShardedValue.shard_index = shard_index
 
     def update_start_time(self, start_time):
         if not start_time:
             return
 
-        with self._start_time.get_lock():
-            if self._start_time.value == 0 or start_time < self._start_time.value:
-                self._start_time.value = start_time
+        self._start_time.record(start_time)
 
     def update_end_time(self, end_time):
         if not end_time:
             return
 
-        with self._end_time.get_lock():
-            if self._end_time.value == 0 or end_time > self._end_time.value:
-                self._end_time.value = end_time
+        self._end_time.record(end_time)
 
     def update_worker_count(self, worker_count):
         if not worker_count:
             return
 
-        with self._worker_count.get_lock():
-            if worker_count > self._worker_count.value:
-                self._worker_count.value = worker_count
+        self._worker_count.record(worker_count)
 
     def update_agent_count(self, agent_count):
         if not agent_count:
             return
 
-        with self._agent_count.get_lock():
-            if agent_count > self._agent_count.value:
-                self._agent_count.value = agent_count
+        self._agent_count.record(agent_count)
+
+    def record_missed_slot(self):
+        self._missed_slots.record(1)
+
+    def record_task(self, task, time_offset=0.0, worker_offset=0, agent_offset=0):
+        # Results from several hosts are combined by shifting the times of each host's tasks onto a common clock and
+        # numbering their workers and agents after those of the hosts before them
+        start_time = task.start_time + time_offset if task.start_time else None
+        end_time = task.end_time + time_offset if task.end_time else None
 
-    def record_task(self, task):
-        self.update_start_time(task.start_time)
-        self.update_end_time(task.end_time)
-        self.update_worker_count(task.worker_index + 1)
-        self.update_agent_count(task.agent_index + 1)
+        self.update_start_time(start_time)
+        self.update_end_time(end_time)
+        self.update_worker_count(task.worker_index + 1 + worker_offset)
+        self.update_agent_count(task.agent_index + 1 + agent_offset)
+        self.agent_idle.record(task.idle_time)
+        self.timeline.record_task(task, end_time)
 
         # print(f"Recorded task started at {task.start_time} and finished at {task.end_time}")
-        # print("Overall start time:", self._start_time.value)
-        # print("Overall end time:", self._end_time.value)
+        # print("Overall start time:", self.start_time)
+        # print("Overall end time:", self.end_time)
         
         if task.create_successful:
             self.create_phases.success.record(task.create_duration)
@@ -91,6 +120,28 @@ class GlobalStats:
             self.update_phases.fail.record(task.update_duration)
             self.full_protocol_runs.fail.record(task.total_duration)
 
+        if task.scheduled_time is not None:
+            if task.update_successful:
+                self.scheduled_runs.success.record(task.scheduled_latency)
+            else:
+                self.scheduled_runs.fail.record(task.scheduled_latency)
+
+        for attempt in task.create_attempts + task.update_attempts:
+            self.queue_waits.record(attempt.queue_time)
+            self.failures.record(attempt)
+
+        if task.deadline_exceeded:
+            self.failures.record_deadline()
+
+        self.retries.record_attempts(task.create_attempts, task.deadline_exceeded)
+        self.retries.record_attempts(task.update_attempts, task.deadline_exceeded)
+
+        for create_attempt in task.create_attempts:
+            self.create_timings.record(create_attempt)
+
+        for update_attempt in task.update_attempts:
+            self.update_timings.record(update_attempt)
+
         for create_attempt in task.create_attempts:
             if create_attempt.ok:
                 self.create_requests.ok.record(create_attempt.duration)
@@ -107,7 +158,32 @@ class GlobalStats:
             else:
                 self.update_requests.fail.record(update_attempt.duration)
 
-    def print_all(self):
+    @staticmethod
+    def make_host_table(host_stats):
+        # Summarises the results of each host separately, given a list of host names and the statistics of each host
+        table = (
+            Table("<24", ">7", ">8", ">8", ">9", ">7", ">7", ">7")
+            .head("host", "workers", "attests", "success", "duration", "att/s", "p50", "p99")
+        )
+
+        for host, stats in host_stats:
+            runs = stats.full_protocol_runs
+            p50, p99 = runs.all.get_percentiles([50, 99])
+            rate = runs.all.count / stats.track_duration if stats.track_duration else None
+
+            table = table.row(
+                host[:24],
+                stats.worker_count,
+                runs.all.count,
+                f"{round(runs.success.percentage * 100, 1)}%" if runs.success.percentage is not None else "--",
+                str(datetime.timedelta(seconds=round(stats.track_duration))),
+                f"{round(rate, 1)}" if rate is not None else "--",
+                *[OutputHelpers.format_duration(d) if d is not None else "--" for d in [p50, p99]]
+            )
+
+        return table
+
+    def print_all(self, host_stats=None):
         print("\n")
         print("\u001b[40;1m" + ("─" * 105) + "\u001b[0m")
         print("\u001b[40;1m" + OutputHelpers.center("TEST RESULT SUMMARY", 105) + "\u001b[0m")
@@ -117,7 +193,35 @@ class GlobalStats:
         seconds = f"({round(self.track_duration, 1)}s)" if self.track_duration > 60 else ""
 
         print(f"\n  Performed {self.full_protocol_runs.all.count} attestations in {friendly_duration} {seconds}")
-        print(f"  Used {self.worker_count} worker processes and {self.agent_count} mock agents\n")
+        print(f"  Used {self.worker_count} worker processes and {self.agent_count} mock agents")
+
+        if self.agent_idle.count:
+            average_f = OutputHelpers.format_duration(self.agent_idle.average_duration)
+            longest_f = OutputHelpers.format_duration(self.agent_idle.longest_duration)
+            print(f"  Agents sat idle for {average_f} on average between attestations (longest {longest_f})")
+
+        if self.queue_waits.count:
+            average_f = OutputHelpers.format_duration(self.queue_waits.average_duration)
+            longest_f = OutputHelpers.format_duration(self.queue_waits.longest_duration)
+            print(f"  Requests waited {average_f} on average for a free client connection (longest {longest_f})")
+
+        print("")
+
+        if host_stats:
+            host_group = (
+                ColumnGroup()
+                .set_title("Hosts", "^")
+                .add(OutputHelpers.center(self.make_host_table(host_stats).output, 90))
+            )
+
+            print(OutputHelpers.center(host_group.get_output(), 103))
+
+        if self.scheduled_slots:
+            missed_f = OutputHelpers.format_count(self.missed_slots, "slot was", "slots were")
+            print(f"  Scheduled {self.scheduled_slots} attestations at a fixed rate, {missed_f} missed as no agent was idle\n")
+
+        if self.retries.backoffs.count or self.retries.abandoned_count:
+            self.retries.print(self.timeline)
 
         create_group = (
             ColumnGroup()
@@ -149,6 +253,21 @@ class GlobalStats:
             )
         )
 
+        timings_group = (
+            ColumnGroup()
+            .set_title("Request Timing Breakdown", "^")
+            .add(
+                ColumnGroup()
+                .set_title("Create Requests", "^")
+                .add(self.create_timings.make_table())
+            )
+            .add(
+                ColumnGroup()
+                .set_title("Update Requests", "^")
+                .add(self.update_timings.make_table())
+            )
+        )
+
         full_protocol_runs_group = (
             ColumnGroup()
             .set_title("Complete Protocol Runs", "^")
@@ -159,7 +278,41 @@ class GlobalStats:
 
         create_group.print()
         update_group.print()
+
+        if self.create_timings.wait.count or self.update_timings.wait.count:
+            timings_group.print()
+
         print(OutputHelpers.center(full_protocol_runs_group.get_output(), 103))
+
+        if self.failures.count or self.failures.deadline_count:
+            self.failures.print()
+
+        if self.scheduled_runs.all.count:
+            scheduled_runs_group = (
+                ColumnGroup()
+                .set_title("Latency From Intended Send Time", "^")
+                .add(
+                    OutputHelpers.center(self.scheduled_runs.make_table("Attestation Tasks").output, 50)
+                )
+            )
+
+            print(OutputHelpers.center(scheduled_runs_group.get_output(), 103))
+
+        timeline_rows = self.timeline.get_rows()
+
+        if timeline_rows:
+            timeline_group = (
+                ColumnGroup()
+                .set_title("Timeline", "^")
+                .add(OutputHelpers.center(self.timeline.make_table(timeline_rows).output, 80))
+            )
+
+            print(OutputHelpers.center(timeline_group.get_output(), 103))
+
+            if self.timeline.truncated:
+                print(f"  Only the last {self.timeline.window_count} intervals of {self.timeline.interval}s are shown, use "
+                      "./report_results to see the timeline of the full run")
+
         print("")
 
     @property
@@ -178,17 +331,57 @@ class GlobalStats:
     def update_phases(self):
         return self._update_phases
 
+    @property
+    def create_timings(self):
+        return self._create_timings
+
+    @property
+    def update_timings(self):
+        return self._update_timings
+
     @property
     def full_protocol_runs(self):
         return self._full_protocol_runs
 
+    @property
+    def scheduled_runs(self):
+        return self._scheduled_runs
+
+    @property
+    def agent_idle(self):
+        return self._agent_idle
+
+    @property
+    def queue_waits(self):
+        return self._queue_waits
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def failures(self):
+        return self._failures
+
+    @property
+    def timeline(self):
+        return self._timeline
+
+    @property
+    def missed_slots(self):
+        return int(self._missed_slots.value)
+
+    @property
+    def scheduled_slots(self):
+        return self.scheduled_runs.all.count + self.missed_slots
+
     @property
     def start_time(self):
-        return self._start_time.value
+        return self._start_time.value or 0.0
 
     @property
     def end_time(self):
-        return self._end_time.value
+        return self._end_time.value or 0.0
 
     @property
     def track_duration(self):
@@ -196,19 +389,19 @@ class GlobalStats:
 
     @property
     def worker_count(self):
-        return self._worker_count.value
+        return int(self._worker_count.value or 0)
 
     @property
     def agent_count(self):
-        return self._agent_count.value
+        return int(self._agent_count.value or 0)
 
 
 class RequestStats:
-    def __init__(self):
-        self._all = StatCounter()
-        self._ok = StatCounter(self._all)
-        self._retry = StatCounter(self._all)
-        self._fail = StatCounter(self._all)
+    def __init__(self, shard_count=1):
+        self._all = StatCounter(shard_count)
+        self._ok = StatCounter(shard_count, self._all)
+        self._retry = StatCounter(shard_count, self._all)
+        self._fail = StatCounter(shard_count, self._all)
 
     def make_table(self, label):
         table = (
@@ -220,6 +413,17 @@ class RequestStats:
             .row("Durations:")
             .times("  Average", self.ok.average_duration, self.retry.average_duration, self.fail.average_duration, self.all.average_duration)
             .times("  Shortest", self.ok.shortest_duration, self.retry.shortest_duration, self.fail.shortest_duration, self.all.shortest_duration)
+        )
+
+        # Merge the histogram shards of each counter once, rather than once per percentile
+        counters = [self.ok, self.retry, self.fail, self.all]
+        percentiles = [counter.get_percentiles([percentile for _, percentile in PERCENTILES]) for counter in counters]
+
+        for i, (label, _) in enumerate(PERCENTILES):
+            table = table.times(f"  {label}", *[values[i] for values in percentiles])
+
+        table = (
+            table
             .times("  Longest", self.ok.longest_duration, self.retry.longest_duration, self.fail.longest_duration, self.all.longest_duration)
         )
 
@@ -243,10 +447,10 @@ class RequestStats:
 
 
 class ProtocolStats:
-    def __init__(self):
-        self._all = StatCounter()
-        self._success = StatCounter(self._all)
-        self._fail = StatCounter(self._all)
+    def __init__(self, shard_count=1):
+        self._all = StatCounter(shard_count)
+        self._success = StatCounter(shard_count, self._all)
+        self._fail = StatCounter(shard_count, self._all)
 
     def make_table(self, label, track_duration=None):
         table = (
@@ -258,6 +462,16 @@ class ProtocolStats:
             .row("Durations:")
             .times("  Average", self.success.average_duration, self.fail.average_duration, self.all.average_duration)
             .times("  Shortest", self.success.shortest_duration, self.fail.shortest_duration, self.all.shortest_duration)
+        )
+
+        counters = [self.success, self.fail, self.all]
+        percentiles = [counter.get_percentiles([percentile for _, percentile in PERCENTILES]) for counter in counters]
+
+        for i, (label, _) in enumerate(PERCENTILES):
+            table = table.times(f"  {label}", *[values[i] for values in percentiles])
+
+        table = (
+            table
             .times("  Longest", self.success.longest_duration, self.fail.longest_duration, self.all.longest_duration)
         )
 
@@ -289,12 +503,446 @@ class ProtocolStats:
         return self._fail
 
 
+class PhaseTimingStats:
+    def __init__(self, shard_count=1):
+        self._dns = StatCounter(shard_count)
+        self._tcp = StatCounter(shard_count)
+        self._tls = StatCounter(shard_count)
+        self._wait = StatCounter(shard_count)
+        self._receive = StatCounter(shard_count)
+
+    def record(self, attempt):
+        phase_durations = attempt.phase_durations
+
+        if not phase_durations:
+            return
+
+        # Connection establishment is only recorded for requests which opened a new connection, so that the time taken
+        # to set up connections is not hidden by requests which reused an existing one
+        if attempt.timings["connect"]:
+            self.dns.record(phase_durations["dns"])
+            self.tcp.record(phase_durations["tcp"])
+            self.tls.record(phase_durations["tls"])
+
+        self.wait.record(phase_durations["wait"])
+        self.receive.record(phase_durations["receive"])
+
+    def record_many(self, phase_durations, connected):
+        # Records the phase durations of many attempts at once, given as NumPy arrays, along with whether each attempt
+        # opened a new connection
+        self.dns.record_many(phase_durations["dns"][connected])
+        self.tcp.record_many(phase_durations["tcp"][connected])
+        self.tls.record_many(phase_durations["tls"][connected])
+        self.wait.record_many(phase_durations["wait"])
+        self.receive.record_many(phase_durations["receive"])
+
+    def make_table(self):
+        counters = [self.dns, self.tcp, self.tls, self.wait, self.receive]
+        percentiles = [counter.get_percentiles([50, 99]) for counter in counters]
+
+        table = (
+            Table("<8", ">6", ">6", ">6", ">6", ">6")
+            .head("", "dns", "tcp", "tls", "wait", "recv")
+            .row("Number", *[counter.count for counter in counters])
+            .times("Average", *[counter.average_duration for counter in counters])
+            .times("Shortest", *[counter.shortest_duration for counter in counters])
+            .times("p50", *[values[0] for values in percentiles])
+            .times("p99", *[values[1] for values in percentiles])
+            .times("Longest", *[counter.longest_duration for counter in counters])
+        )
+
+        return table
+
+    @property
+    def dns(self):
+        return self._dns
+
+    @property
+    def tcp(self):
+        return self._tcp
+
+    @property
+    def tls(self):
+        return self._tls
+
+    @property
+    def wait(self):
+        return self._wait
+
+    @property
+    def receive(self):
+        return self._receive
+
+
+# Breaks a run down into windows of a fixed interval, by the time at which each attestation completed, so that changes
+# in throughput and latency over the course of a long run are not hidden by the totals. Windows are kept in a ring
+# buffer, so only the most recent windows are available once the buffer wraps around
+class TimelineStats:
+    # Number of windows kept by default, e.g., the last hour of a run when using 10 second intervals
+    WINDOW_COUNT = 360
+    # Max. no. of rows shown in the report, with consecutive windows combined into a single row as needed
+    MAX_ROWS = 24
+
+    def __init__(self, shard_count=1, interval=10, origin=None, window_count=None):
+        self._interval = interval
+        self._origin = origin if origin is not None else time.perf_counter()
+        self._windows = [TimelineWindow(shard_count) for _ in range(window_count or self.WINDOW_COUNT)]
+
+    def record_task(self, task, end_time):
+        if not end_time:
+            return
+
+        index = max(int((end_time - self.origin) // self.interval), 0)
+        window = self._windows[index % self.window_count]
+
+        if not window.claim(index):
+            return
+
+        if task.update_successful:
+            window.success.record(1)
+        else:
+            window.fail.record(1)
+
+        window.retries.record(max(len(task.create_attempts) - 1, 0) + max(len(task.update_attempts) - 1, 0))
+
+        if task.create_duration is not None:
+            window.create_latency.record(task.create_duration)
+
+        if task.update_duration is not None:
+            window.update_latency.record(task.update_duration)
+
+    def record_many(self, end_times, successful, retries, create_durations, update_durations):
+        # Records many attestations at once, given as NumPy arrays of the values of each attestation. Windows are filled
+        # in order, so the result is the same as recording the attestations one by one in the order they completed
+        indices = numpy.maximum(((end_times - self.origin) // self.interval).astype(numpy.int64), 0)
+        order = numpy.argsort(indices, kind="stable")
+        window_indices, starts = numpy.unique(indices[order], return_index=True)
+        ends = numpy.append(starts[1:], len(order))
+
+        for index, start, end in zip(window_indices.tolist(), starts.tolist(), ends.tolist()):
+            window = self._windows[index % self.window_count]
+
+            if not window.claim(index):
+                continue
+
+            selected = order[start:end]
+            success_count = int(numpy.count_nonzero(successful[selected]))
+
+            window.success.record(success_count)
+            window.fail.record(len(selected) - success_count)
+            window.retries.record(int(retries[selected].sum()))
+            window.create_latency.record_many(create_durations[selected])
+            window.update_latency.record_many(update_durations[selected])
+
+    def get_rows(self, max_rows=None):
+        # Consecutive windows are combined so that no more than the given no. of rows are returned
+        last_index = self.latest_index
+
+        if last_index is None:
+            return []
+
+        # Skip any windows before the first attestation completed, e.g., while mock agents were being created
+        first_index = max(last_index - self.window_count + 1, self.earliest_index)
+        group_size = max(math.ceil((last_index - first_index + 1) / (max_rows or self.MAX_ROWS)), 1)
+        rows = []
+
+        for group_start in range(first_index, last_index + 1, group_size):
+            group_end = min(group_start + group_size, last_index + 1)
+            success = 0
+            fail = 0
+            retries = 0
+            create_counts = [0] * CoarseHistogram.bucket_count()
+            update_counts = [0] * CoarseHistogram.bucket_count()
+
+            for index in range(group_start, group_end):
+                window = self._windows[index % self.window_count]
+                shards = window.get_shards(index)
+
+                if not shards:
+                    continue
+
+                success += window.success.get_value(shards)
+                fail += window.fail.get_value(shards)
+                retries += window.retries.get_value(shards)
+                create_counts = [a + b for a, b in zip(create_counts, window.create_latency.get_counts(shards))]
+                update_counts = [a + b for a, b in zip(update_counts, window.update_latency.get_counts(shards))]
+
+            rows.append({
+                "start": group_start * self.interval,
+                "duration": (group_end - group_start) * self.interval,
+                "success": int(success),
+                "fail": int(fail),
+                "retries": int(retries),
+                "create_latency": CoarseHistogram.percentiles_from_counts(create_counts, [50, 99]),
+                "update_latency": CoarseHistogram.percentiles_from_counts(update_counts, [50, 99])
+            })
+
+        return rows
+
+    def make_table(self, rows):
+        # Each row ends with a bar showing its rate of attestations relative to the highest rate in the timeline
+        bars = " ▁▂▃▄▅▆▇█"
+        rates = [(row["success"] + row["fail"]) / row["duration"] for row in rows]
+        max_rate = max(rates, default=0)
+
+        table = (
+            Table("<9", ">7", ">7", ">6", ">6", ">7", ">7", ">7", ">7", "<1")
+            .head("elapsed", "att/s", "success", "fail", "retry", "cr p50", "cr p99", "up p50", "up p99", "")
+        )
+
+        for row, rate in zip(rows, rates):
+            bar = bars[math.ceil(rate / max_rate * (len(bars) - 1))] if max_rate else bars[0]
+
+            table = table.row(
+                self.format_start(row["start"]),
+                f"{round(rate, 1)}",
+                row["success"],
+                row["fail"],
+                row["retries"],
+                *[OutputHelpers.format_duration(d) if d is not None else "--" for d in row["create_latency"]],
+                *[OutputHelpers.format_duration(d) if d is not None else "--" for d in row["update_latency"]],
+                bar
+            )
+
+        return table
+
+    def format_start(self, start):
+        # Formats the time at which a row starts, relative to the origin, as hours, minutes and seconds
+        minutes, seconds = divmod(start, 60)
+        hours, minutes = divmod(int(minutes), 60)
+        seconds_f = f"{seconds:02.0f}" if float(self.interval).is_integer() else f"{seconds:04.1f}"
+        return f"{hours}:{minutes:02}:{seconds_f}"
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def origin(self):
+        return self._origin
+
+    @property
+    def window_count(self):
+        return len(self._windows)
+
+    @property
+    def latest_index(self):
+        return max([window.latest_index for window in self._windows if window.latest_index is not None], default=None)
+
+    @property
+    def earliest_index(self):
+        return min([window.earliest_index for window in self._windows if window.earliest_index is not None], default=None)
+
+    @property
+    def truncated(self):
+        # Whether earlier windows have been overwritten by later ones
+        latest_index = self.latest_index
+        return latest_index is not None and latest_index >= self.window_count
+
+
+# Counts of the attestations which completed within a single timeline window. Each shard records which window it
+# currently holds, so that a worker can reuse its shard for a newer window without any locks
+class TimelineWindow:
+    def __init__(self, shard_count=1):
+        self._indices = ShardedValue(shard_count, "max")
+        self._success = ShardedValue(shard_count)
+        self._fail = ShardedValue(shard_count)
+        self._retries = ShardedValue(shard_count)
+        self._create_latency = CoarseHistogram(shard_count)
+        self._update_latency = CoarseHistogram(shard_count)
+
+    def claim(self, index):
+        current_index = self._indices.get_value([ShardedValue.shard_index])
+
+        if current_index == index:
+            return True
+
+        # Attestations which complete after the window has been reused for a newer one are dropped
+        if current_index is not None and current_index > index:
+            return False
+
+        self._indices.reset_shard()
+        self._success.reset_shard()
+        self._fail.reset_shard()
+        self._retries.reset_shard()
+        self._create_latency.reset_shard()
+        self._update_latency.reset_shard()
+        self._indices.record(index)
+        return True
+
+    def get_shards(self, index):
+        return [shard for shard in range(self._indices.shard_count) if self._indices.get_value([shard]) == index]
+
+    @property
+    def latest_index(self):
+        index = self._indices.value
+        return int(index) if index is not None else None
+
+    @property
+    def earliest_index(self):
+        indices = [self._indices.get_value([shard]) for shard in range(self._indices.shard_count)]
+        return min([int(index) for index in indices if index is not None], default=None)
+
+    @property
+    def success(self):
+        return self._success
+
+    @property
+    def fail(self):
+        return self._fail
+
+    @property
+    def retries(self):
+        return self._retries
+
+    @property
+    def create_latency(self):
+        return self._create_latency
+
+    @property
+    def update_latency(self):
+        return self._update_latency
+
+
+# Retries of requests which the verifier asked to be retried, as recorded from the attempts of each task. The time
+# between the end of one attempt and the start of the next is the backoff chosen by the retry policy. Intervals of the
+# timeline in which more requests were retried than attestations completed are reported as retry storms, as these show
+# agents retrying together and adding to the load on the verifier rather than spreading out
+class RetryStats:
+    # Retries per completed attestation above which an interval of the timeline counts as a retry storm
+    STORM_RATIO = 1.0
+
+    def __init__(self, shard_count=1):
+        self._backoffs = StatCounter(shard_count)
+        self._abandoned = ShardedValue(shard_count)
+
+    def record_attempts(self, attempts, deadline_exceeded=False):
+        # Records the attempts at a single request, in the order they were made
+        for attempt, next_attempt in zip(attempts, attempts[1:]):
+            if attempt.end_time and next_attempt.start_time:
+                self.backoffs.record(max(next_attempt.start_time - attempt.end_time, 0.0))
+
+        # The last attempt was asked to be retried but was not, so unless the deadline of the attestation was reached,
+        # the retry policy must have given up
+        if attempts and not attempts[-1].ok and attempts[-1].retry_after and not deadline_exceeded:
+            self.record_abandoned()
+
+    def record_abandoned(self, count=1):
+        self._abandoned.record(count)
+
+    @classmethod
+    def get_storm_rows(cls, timeline_rows):
+        return [
+            row for row in timeline_rows
+            if row["retries"] and row["retries"] > cls.STORM_RATIO * (row["success"] + row["fail"])
+        ]
+
+    def print(self, timeline):
+        average_f = OutputHelpers.format_duration(self.backoffs.average_duration or 0.0)
+        longest_f = OutputHelpers.format_duration(self.backoffs.longest_duration or 0.0)
+        print(f"  Retried {OutputHelpers.format_count(self.backoffs.count, 'request', 'requests')} at the verifier's "
+              f"request, waiting {average_f} on average before each retry (longest {longest_f})")
+
+        if self.abandoned_count:
+            abandoned_f = OutputHelpers.format_count(self.abandoned_count, "attestation", "attestations")
+            print(f"  Gave up on {abandoned_f} as the retry policy allowed no further retries")
+
+        # Storms are found in individual windows, as combining windows into fewer rows would hide short bursts
+        rows = timeline.get_rows(max_rows=timeline.window_count)
+        storm_rows = self.get_storm_rows(rows)
+
+        if storm_rows:
+            worst = max(storm_rows, key=lambda row: row["retries"])
+            intervals_f = OutputHelpers.format_count(len(rows), "interval", "intervals")
+            print(f"  Retry storms, with more retries than attestations completed, occurred in {len(storm_rows)} of "
+                  f"{intervals_f}")
+            print(f"  The worst was at {timeline.format_start(worst['start'])}, with {worst['retries']} retries and "
+                  f"{worst['success'] + worst['fail']} attestations completed")
+
+        print("")
+
+    @property
+    def backoffs(self):
+        return self._backoffs
+
+    @property
+    def abandoned_count(self):
+        return int(self._abandoned.value)
+
+
+# Counts and durations of failed requests by their cause, so that a verifier which is overloaded, and so times out or
+# refuses connections, can be told apart from one which rejects requests or responds with something unexpected. The
+# no. of attestations given up on when their deadline was reached is counted separately, as no request may have failed,
+# e.g., when the deadline passed while waiting to retry
+class FailureStats:
+    def __init__(self, shard_count=1):
+        self._all = StatCounter(shard_count)
+        self._causes = {cause: StatCounter(shard_count, self._all) for cause in RequestAttempt.FAILURE_TYPES}
+        self._deadlines = ShardedValue(shard_count)
+
+    def record(self, attempt):
+        if attempt.failure in self._causes:
+            self._causes[attempt.failure].record(attempt.duration or 0.0)
+
+    def record_deadline(self, count=1):
+        self._deadlines.record(count)
+
+    def make_table(self):
+        table = (
+            Table("<20", ">7", ">7", ">8", ">8", ">8", ">8")
+            .head("cause", "count", "share", "average", "p50", "p99", "longest")
+        )
+
+        for cause, counter in self.causes.items():
+            if not counter.count:
+                continue
+
+            p50, p99 = counter.get_percentiles([50, 99])
+            durations = [counter.average_duration, p50, p99, counter.longest_duration]
+
+            table = table.row(
+                cause,
+                counter.count,
+                f"{round(counter.percentage * 100, 1)}%",
+                *[OutputHelpers.format_duration(duration) for duration in durations]
+            )
+
+        return table
+
+    def print(self):
+        if self.count:
+            failures_group = (
+                ColumnGroup()
+                .set_title("Failed Requests by Cause", "^")
+                .add(OutputHelpers.center(self.make_table().output, 80))
+            )
+
+            print(OutputHelpers.center(failures_group.get_output(), 103))
+
+        if self.deadline_count:
+            deadlines_f = OutputHelpers.format_count(self.deadline_count, "attestation", "attestations")
+            print(f"  Gave up on {deadlines_f} on reaching the deadline\n")
+
+    @property
+    def causes(self):
+        return self._causes.copy()
+
+    @property
+    def count(self):
+        return self._all.count
+
+    @property
+    def deadline_count(self):
+        return int(self._deadlines.value)
+
+
 class StatCounter:
-    def __init__(self, total_counter=None):
-        self._count = Value(ctypes.c_int, 0)
-        self._total_duration = Value(ctypes.c_double, 0.0)
-        self._shortest_duration = Value(ctypes.c_float, 9999.0)
-        self._longest_duration = Value(ctypes.c_float, 0.0)
+    def __init__(self, shard_count=1, total_counter=None):
+        self._count = ShardedValue(shard_count)
+        self._total_duration = ShardedValue(shard_count)
+        self._shortest_duration = ShardedValue(shard_count, "min")
+        self._longest_duration = ShardedValue(shard_count, "max")
+        self._histogram = Histogram(shard_count)
 
         self._total_counter = None
 
@@ -305,22 +953,45 @@ class StatCounter:
         if duration is None:
             return
 
-        with self._count.get_lock():
-            self._count.value += 1
+        self._count.record(1)
+        self._total_duration.record(duration)
+        self._shortest_duration.record(duration)
+        self._longest_duration.record(duration)
+        self._histogram.record(duration)
 
-        with self._total_duration.get_lock():
-            self._total_duration.value += duration
-    
-        with self._shortest_duration.get_lock():
-            if duration < self._shortest_duration.value:
-                self._shortest_duration.value = duration
+        if self.total_counter:
+            self.total_counter.record(duration)
+
+    def record_many(self, durations):
+        # Records a NumPy array of durations at once, skipping any which are missing (NaN)
+        durations = durations[~numpy.isnan(durations)]
+
+        if not len(durations):
+            return
 
-        with self._longest_duration.get_lock():
-            if duration > self._longest_duration.value:
-                self._longest_duration.value = duration
+        self._count.record(len(durations))
+        self._total_duration.record(float(durations.sum()))
+        self._shortest_duration.record(float(durations.min()))
+        self._longest_duration.record(float(durations.max()))
+        self._histogram.record_many(durations)
 
         if self.total_counter:
-            self.total_counter.record(duration)
+            self.total_counter.record_many(durations)
+
+    def get_percentile(self, percentile):
+        return self.get_percentiles([percentile])[0]
+
+    def get_percentiles(self, percentiles):
+        if not self.count:
+            return [None] * len(percentiles)
+
+        # The histogram only approximates each duration, so the results are kept within the range actually observed
+        shortest = self.shortest_duration
+        longest = self.longest_duration
+
+        return [
+            min(max(duration, shortest), longest) for duration in self._histogram.get_percentiles(percentiles)
+        ]
 
     def get_rate(self, denominator):
         if not denominator:
@@ -330,7 +1001,7 @@ class StatCounter:
 
     @property
     def count(self):
-        return self._count.value
+        return int(self._count.value)
 
     @property
     def total_duration(self):
@@ -360,6 +1031,10 @@ class StatCounter:
 
         return self.total_duration / self.count
 
+    @property
+    def histogram(self):
+        return self._histogram
+
     @property
     def total_counter(self):
         return self._total_counter
@@ -370,3 +1045,208 @@ class StatCounter:
             return None
 
         return self.count / self.total_counter.count
+
+
+# Counts durations in buckets whose width grows with the duration, in the manner of an HDR histogram, so that any
+# percentile can be estimated to within a small relative error using a fixed amount of shared memory
+class Histogram:
+    # Durations are counted in whole microseconds, with each power of two split into 2^(SUB_BUCKET_BITS-1) buckets
+    SUB_BUCKET_BITS = 6
+    MAX_BIT_LENGTH = 37
+
+    def __init__(self, shard_count=1):
+        self._shard_count = shard_count
+        self._bucket_count = self.bucket_count()
+        self._counts = RawArray(ctypes.c_int64, shard_count * self._bucket_count)
+
+    @classmethod
+    def bucket_count(cls):
+        return cls.bucket_index(2 ** cls.MAX_BIT_LENGTH - 1) + 1
+
+    @classmethod
+    def bucket_index(cls, micros):
+        linear_count = 2 ** cls.SUB_BUCKET_BITS
+
+        if micros < linear_count:
+            return micros
+
+        shift = min(micros.bit_length(), cls.MAX_BIT_LENGTH) - cls.SUB_BUCKET_BITS
+        sub_bucket = min(micros >> shift, linear_count - 1) - linear_count // 2
+        return linear_count + (shift - 1) * (linear_count // 2) + sub_bucket
+
+    @classmethod
+    def bucket_midpoint(cls, index):
+        linear_count = 2 ** cls.SUB_BUCKET_BITS
+
+        if index < linear_count:
+            return index
+
+        shift = (index - linear_count) // (linear_count // 2) + 1
+        sub_bucket = (index - linear_count) % (linear_count // 2) + linear_count // 2
+        return (sub_bucket << shift) + (1 << shift) / 2
+
+    @classmethod
+    def bucket_upper_bound(cls, index):
+        # Returns the smallest no. of microseconds which is too large to be counted in the bucket
+        linear_count = 2 ** cls.SUB_BUCKET_BITS
+
+        if index < linear_count:
+            return index + 1
+
+        shift = (index - linear_count) // (linear_count // 2) + 1
+        sub_bucket = (index - linear_count) % (linear_count // 2) + linear_count // 2
+        return (sub_bucket + 1) << shift
+
+    @classmethod
+    def cumulative_from_counts(cls, counts, bounds):
+        # Returns the no. of durations no greater than each bound (in seconds), as used by Prometheus-style histograms.
+        # Buckets which straddle a bound are counted against the next bound
+        results = []
+        cumulative = 0
+        index = 0
+
+        for bound in sorted(bounds):
+            while index < len(counts) and cls.bucket_upper_bound(index) <= bound * 1000000:
+                cumulative += counts[index]
+                index += 1
+
+            results.append(cumulative)
+
+        return results
+
+    @classmethod
+    def bucket_indices(cls, micros):
+        # Equivalent to bucket_index for a NumPy array of durations in whole microseconds
+        linear_count = 2 ** cls.SUB_BUCKET_BITS
+
+        # The exponent returned by frexp is the bit length of each value, which is exact for values below 2^53
+        _, bit_lengths = numpy.frexp(micros.astype(numpy.float64))
+        shifts = numpy.maximum(numpy.minimum(bit_lengths, cls.MAX_BIT_LENGTH) - cls.SUB_BUCKET_BITS, 0)
+        sub_buckets = numpy.minimum(micros >> shifts, linear_count - 1) - linear_count // 2
+        indices = linear_count + (shifts - 1) * (linear_count // 2) + sub_buckets
+
+        return numpy.where(micros < linear_count, micros, indices)
+
+    def record(self, duration):
+        index = self.bucket_index(max(int(duration * 1000000), 0))
+        self._counts[ShardedValue.shard_index * self._bucket_count + index] += 1
+
+    def record_many(self, durations):
+        # Records a NumPy array of durations at once, adding the counts of each bucket to the shard in one step
+        micros = numpy.maximum((durations * 1000000).astype(numpy.int64), 0)
+        counts = numpy.bincount(self.bucket_indices(micros), minlength=self._bucket_count)
+        start = ShardedValue.shard_index * self._bucket_count
+        numpy.frombuffer(self._counts, dtype=numpy.int64)[start:start + self._bucket_count] += counts
+
+    def get_percentile(self, percentile):
+        return self.get_percentiles([percentile])[0]
+
+    def get_percentiles(self, percentiles):
+        return self.percentiles_from_counts(self.counts, percentiles)
+
+    @classmethod
+    def percentiles_from_counts(cls, counts, percentiles):
+        total = sum(counts)
+
+        if not total:
+            return [None] * len(percentiles)
+
+        results = []
+        cumulative = 0
+        index = -1
+
+        for percentile in sorted(percentiles):
+            target = max(math.ceil(total * percentile / 100), 1)
+
+            while cumulative < target:
+                index += 1
+                cumulative += counts[index]
+
+            results.append((percentile, cls.bucket_midpoint(index) / 1000000))
+
+        # Return the results in the order in which the percentiles were requested
+        lookup = dict(results)
+        return [lookup[percentile] for percentile in percentiles]
+
+    def reset_shard(self):
+        start = ShardedValue.shard_index * self._bucket_count
+        self._counts[start:start + self._bucket_count] = [0] * self._bucket_count
+
+    def get_counts(self, shards):
+        bucket_count = self._bucket_count
+        counts = [0] * bucket_count
+
+        for shard in shards:
+            start = shard * bucket_count
+            counts = [a + b for a, b in zip(counts, self._counts[start:start + bucket_count])]
+
+        return counts
+
+    @property
+    def counts(self):
+        return self.get_counts(range(self._shard_count))
+
+
+# A histogram with fewer buckets per power of two, for when many histograms need to be kept at once, at the cost of
+# estimating percentiles to within about 6% instead of about 2%
+class CoarseHistogram(Histogram):
+    SUB_BUCKET_BITS = 4
+
+
+# A number held in shared memory which is split into one shard per process. Each process only ever writes to its own
+# shard, so no lock is needed, and the shards are combined by summing them or by taking the smallest or largest value
+class ShardedValue:
+    # Index of the shard which the current process writes to
+    shard_index = 0
+
+    def __init__(self, shard_count=1, merge="sum"):
+        self._merge = merge
+        self._shards = RawArray(ctypes.c_double, shard_count)
+
+        self._shards[:] = [self.initial_value] * shard_count
+
+    def reset_shard(self):
+        self._shards[ShardedValue.shard_index] = self.initial_value
+
+    def record(self, value):
+        i = ShardedValue.shard_index
+
+        if self._merge == "sum":
+            self._shards[i] += value
+        elif self._merge == "min":
+            if value < self._shards[i]:
+                self._shards[i] = value
+        elif value > self._shards[i]:
+            self._shards[i] = value
+
+    def get_value(self, shards):
+        shards = [self._shards[i] for i in shards]
+
+        if self._merge == "sum":
+            return sum(shards)
+
+        value = min(shards, default=math.inf) if self._merge == "min" else max(shards, default=-math.inf)
+
+        # Shards which have never been written to hold an infinite value
+        if math.isinf(value):
+            return None
+
+        return value
+
+    @property
+    def value(self):
+        return self.get_value(range(self.shard_count))
+
+    @property
+    def initial_value(self):
+        if self._merge == "min":
+            return math.inf
+
+        if self._merge == "max":
+            return -math.inf
+
+        return 0.0
+
+    @property
+    def shard_count(self):
+        return len(self._shards)
@@ -15,16 +15,22 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import asyncio
 import ctypes
+import math
 
 from multiprocessing import Value, Array
 from multiprocessing.sharedctypes import Synchronized
 from datetime import datetime, timezone
+from tornado.httpclient import AsyncHTTPClient
 
 from perf_tests.attestation_task import AttestationTask
-from perf_tests.agent import Agent
+from perf_tests.agent import Agent, AgentStateTable
+from perf_tests.agent_leases import AgentLeaseTable
 from perf_tests.stats import GlobalStats
 from perf_tests.result_serializer import ResultSerializer
+from perf_tests.worker_load import WorkerLoadStats
+from perf_tests.retry_policy import RetryPolicy
 
 
 class TaskManager:
@@ -32,58 +38,67 @@ class TaskManager:
         self._execution = execution
 
         self._new_tasks_allowed = Value(ctypes.c_bool, True)
-        self._next_agent_index = Value(ctypes.c_int, 0)
-        self._agents = []
-
-        for i in range(execution.agent_count):
-            self._agents.append(Agent(self, i))
-
+        self._agent_states = AgentStateTable(execution.agent_count)
+        self._leases = AgentLeaseTable(execution.agent_count)
         self._current_worker_tasks = set()
-        self._stats = GlobalStats()
+        self._worker_concluded_count = 0
+        self._agent_releases = None
+        self._http_client = None
+        self._stats = GlobalStats(execution.worker_count, execution.interval)
+        self._worker_load = WorkerLoadStats(execution.worker_count)
+        self._retry_policy = RetryPolicy(
+            execution.worker_count, execution.retry_base_delay, execution.retry_max_delay, execution.retry_max_attempts,
+            execution.retry_budget, execution.retry_jitter, execution.retry_after
+        )
         self._serializer = ResultSerializer()
 
-    def _increment_next_agent(self):
-        with self._next_agent_index.get_lock():
-            if self._next_agent_index.value < self.agent_count - 1:
-                self._next_agent_index.value += 1
-            else:
-                self._next_agent_index.value = 0
-
     def new_task(self, worker_index, evidence):
-        with self._next_agent_index.get_lock():
-            if not self.new_tasks_allowed or self.all_finished:
-                raise StopIteration
-
-            if self.all_busy:
-                return None
+        if not self.new_tasks_allowed or self.all_finished:
+            raise StopIteration
 
-            # print("finding next available agent")
-            # print(self.next_agent.busy)
-            # print(self.next_agent.finished)
-            # print(self.tasks_per_agent)
+        agent_index = self.leases.acquire()
 
-            while self.next_agent.busy or self.next_agent.finished:
-                self._increment_next_agent()
+        if agent_index is None:
+            return None
 
-            # print("agent index:", self.next_agent.index)
-            # print("agent task count:", self.next_agent.task_count)
+        agent = self.get_agent(agent_index)
+        task = agent.new_task(worker_index, evidence)
+        self._current_worker_tasks.add(task)
 
-            task = self.next_agent.new_task(worker_index, evidence)
-            self._increment_next_agent()
-            self._current_worker_tasks.add(task)
+        if agent.finished:
+            self.leases.retire(agent_index)
 
         return task
 
+    def release_agent(self, agent):
+        self.leases.release(agent.index, requeue=not agent.finished)
+
     def conclude_task(self, task):
         self._current_worker_tasks.remove(task)
+        self._worker_concluded_count += 1
         self.serializer.queue_task(task)
         self.stats.record_task(task)
 
+        # Wake the worker's scheduler, if it is waiting, so that it can start a new task using the released agent
+        if self._agent_releases is not None:
+            self._agent_releases.put_nowait(task.agent)
+
+    async def wait_for_release(self, timeout):
+        # The queue is created on first use so that it belongs to the event loop of the worker process which awaits it
+        if self._agent_releases is None:
+            self._agent_releases = asyncio.Queue()
+
+        try:
+            return await asyncio.wait_for(self._agent_releases.get(), timeout)
+        except asyncio.TimeoutError:
+            # Agents may also be released by tasks belonging to other worker processes
+            return None
+
     def get_agent(self, index_or_id):
         if isinstance(index_or_id, str):
             index_or_id = int(index_or_id.split("perf-test-agent-")[-1])
 
-        return self.agents[index_or_id]
+        return Agent(self, index_or_id)
 
     def disallow_new_tasks(self):
         self._new_tasks_allowed.value = False
@@ -94,39 +109,85 @@ class TaskManager:
 
     @property
     def agents(self):
-        return self._agents.copy()
+        return [Agent(self, i) for i in range(self.agent_count)]
+
+    @property
+    def agent_states(self):
+        return self._agent_states
 
     @property
     def agent_count(self):
-        return len(self.agents)
+        return self.agent_states.agent_count
 
     @property
-    def tasks_per_agent(self):
-        return self._execution.task_count
+    def agent_state_size(self):
+        return self.agent_states.size + self.leases.size
 
     @property
-    def next_agent(self):
-        return self.get_agent(self._next_agent_index.value)
+    def tasks_per_agent(self):
+        return self._execution.task_count
 
     @property
     def new_tasks_allowed(self):
         return self._new_tasks_allowed.value
 
+    @property
+    def leases(self):
+        return self._leases
+
+    @property
+    def busy_count(self):
+        return self.leases.busy_count
+
     @property
     def all_busy(self):
-        return all(agent.busy for agent in self.agents)
+        return not self.leases.idle_count
 
     @property
     def all_finished(self):
         if not self.tasks_per_agent:
             return False
-        
-        return all(agent.finished for agent in self.agents)
+
+        return self.leases.retired_count >= self.agent_count
 
     @property
     def current_worker_tasks(self):
         return self._current_worker_tasks.copy()
 
+    @property
+    def current_worker_task_count(self):
+        return len(self._current_worker_tasks)
+
+    @property
+    def worker_concluded_count(self):
+        # No. of tasks concluded by the current worker process
+        return self._worker_concluded_count
+
+    @property
+    def worker_task_limit(self):
+        return math.ceil(self.agent_count / self.execution.worker_count)
+
+    @property
+    def http_client(self):
+        # Each worker process creates a single client on first use, which is then shared by all requests issued by the
+        # worker so that connections to the verifier can be kept alive and reused
+        if not self._http_client:
+            AsyncHTTPClient.configure(
+                "tornado.curl_httpclient.CurlAsyncHTTPClient",
+                max_clients=self.execution.max_connections
+            )
+            self._http_client = AsyncHTTPClient()
+
+        return self._http_client
+
+    @property
+    def retry_policy(self):
+        return self._retry_policy
+
+    @property
+    def worker_load(self):
+        return self._worker_load
+
     @property
     def stats(self):
         return self._stats
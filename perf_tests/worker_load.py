@@ -0,0 +1,168 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import ctypes
+
+from multiprocessing import RawArray
+
+from perf_tests.output import OutputHelpers, Table, ColumnGroup
+
+
+# Tracks how heavily loaded each worker process is, from probes which each worker takes of its own event loop. A probe
+# measures how late the loop wakes from a short sleep and the share of the time since the previous probe which the
+# worker spent on the CPU. When either is high, the worker cannot keep up with its tasks, so the durations it records
+# include time spent waiting for its own event loop and overstate the latency of the verifier. Each worker only writes
+# to its own element of the shared totals, so no lock is needed
+class WorkerLoadStats:
+    RECORD_TYPE = "worker_load"
+    # Time (in seconds) between probes and no. of probes summarised in each record saved alongside the results
+    PROBE_INTERVAL = 0.5
+    PROBES_PER_RECORD = 10
+    # A probe finds the worker saturated if the event loop woke this late (in seconds) or the CPU was this busy
+    LAG_THRESHOLD = 0.05
+    CPU_THRESHOLD = 0.9
+    # Share of probes which must find a worker saturated for the report to warn about it
+    WARNING_THRESHOLD = 0.1
+    # Max. no. of workers listed in the report, which lists the most heavily loaded first
+    MAX_ROWS = 16
+
+    TOTALS = ["probe_count", "saturated_count", "lag_total", "max_lag", "cpu_time", "wall_time"]
+
+    def __init__(self, worker_count):
+        self._latest_lags = RawArray(ctypes.c_double, worker_count)
+        self._latest_cpu = RawArray(ctypes.c_double, worker_count)
+        self._totals = {name: RawArray(ctypes.c_double, worker_count) for name in self.TOTALS}
+
+    @classmethod
+    def is_saturated(cls, lag, cpu_time, wall_time):
+        return lag >= cls.LAG_THRESHOLD or (wall_time > 0 and cpu_time / wall_time >= cls.CPU_THRESHOLD)
+
+    @classmethod
+    def summarise(cls, probes):
+        # Combines a list of probes, each given as a tuple of the loop lag, CPU time and wall-clock time, into totals
+        return {
+            "probe_count": len(probes),
+            "saturated_count": sum(1 for probe in probes if cls.is_saturated(*probe)),
+            "lag_total": sum(lag for lag, _, _ in probes),
+            "max_lag": max((lag for lag, _, _ in probes), default=0.0),
+            "cpu_time": sum(cpu_time for _, cpu_time, _ in probes),
+            "wall_time": sum(wall_time for _, _, wall_time in probes)
+        }
+
+    @classmethod
+    def from_records(cls, records, worker_count):
+        # Rebuilds the totals of each worker from the records saved alongside the results
+        stats = cls(worker_count)
+
+        for record in records:
+            stats.record(record["worker_index"], record)
+
+        return stats
+
+    def record(self, worker_index, summary):
+        for name in self.TOTALS:
+            if name == "max_lag":
+                self._totals[name][worker_index] = max(self._totals[name][worker_index], summary[name])
+            else:
+                self._totals[name][worker_index] += summary[name]
+
+    def record_probe(self, worker_index, lag, cpu_time, wall_time):
+        self._latest_lags[worker_index] = lag
+        self._latest_cpu[worker_index] = cpu_time / wall_time if wall_time > 0 else 0.0
+        self.record(worker_index, self.summarise([(lag, cpu_time, wall_time)]))
+
+    def get_rows(self):
+        # Returns the load of each worker which took any probes, the most heavily loaded first
+        rows = []
+
+        for worker_index in range(self.worker_count):
+            totals = {name: self._totals[name][worker_index] for name in self.TOTALS}
+
+            if not totals["probe_count"]:
+                continue
+
+            rows.append({
+                "worker_index": worker_index,
+                "cpu": totals["cpu_time"] / totals["wall_time"] if totals["wall_time"] else None,
+                "mean_lag": totals["lag_total"] / totals["probe_count"],
+                "max_lag": totals["max_lag"],
+                "saturated": totals["saturated_count"] / totals["probe_count"]
+            })
+
+        return sorted(rows, key=lambda row: (row["saturated"], row["mean_lag"]), reverse=True)
+
+    def get_saturated_rows(self):
+        return [row for row in self.get_rows() if row["saturated"] >= self.WARNING_THRESHOLD]
+
+    def make_table(self, rows):
+        table = (
+            Table(">6", ">7", ">9", ">9", ">10")
+            .head("worker", "cpu %", "avg lag", "max lag", "saturated")
+        )
+
+        for row in rows:
+            table = table.row(
+                row["worker_index"],
+                f"{round(row['cpu'] * 100, 1)}%" if row["cpu"] is not None else "--",
+                OutputHelpers.format_duration(row["mean_lag"]),
+                OutputHelpers.format_duration(row["max_lag"]),
+                f"{round(row['saturated'] * 100, 1)}%"
+            )
+
+        return table
+
+    def print(self):
+        rows = self.get_rows()
+
+        if not rows:
+            return
+
+        load_group = (
+            ColumnGroup()
+            .set_title("Worker Load", "^")
+            .add(OutputHelpers.center(self.make_table(rows[:self.MAX_ROWS]).output, 60))
+        )
+
+        print(OutputHelpers.center(load_group.get_output(), 103))
+
+        if len(rows) > self.MAX_ROWS:
+            print(f"  Only the {self.MAX_ROWS} most heavily loaded of {len(rows)} workers are shown")
+
+        saturated_rows = self.get_saturated_rows()
+
+        if saturated_rows:
+            workers_f = OutputHelpers.format_count(len(saturated_rows), "worker was", "workers were")
+            lag_f = OutputHelpers.format_duration(max(row["max_lag"] for row in saturated_rows))
+
+            print(f"\n  \u001b[33;1mWarning:\u001b[0m {workers_f} saturated for at least "
+                  f"{round(self.WARNING_THRESHOLD * 100)}% of the run, with event loop lag of up to {lag_f}.")
+            print("  The durations they recorded include time spent waiting for their own event loop, so they overstate")
+            print("  the latency of the verifier. Use more worker processes, fewer agents or a lower rate to avoid this")
+
+        print("")
+
+    @property
+    def latest_lags(self):
+        return self._latest_lags[:]
+
+    @property
+    def latest_cpu(self):
+        return self._latest_cpu[:]
+
+    @property
+    def worker_count(self):
+        return len(self._latest_lags)
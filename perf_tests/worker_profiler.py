@@ -0,0 +1,163 @@
+# (C) Copyright 2024 Hewlett Packard Enterprise Development LP
+# Author: Jean Snyman <jean.snyman@hpe.com>
+# Author: Supreshna Gurung <supreshna.gurung@hpe.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import cProfile
+import pstats
+
+from pathlib import Path
+
+from perf_tests.output import OutputHelpers, Table, ColumnGroup
+
+
+# Profiles a single worker process using cProfile and saves the profile next to the results, named after the results
+# file and the worker, e.g., "results/20240101120000.worker0.prof". The files can be opened with any tool which reads
+# the output of cProfile, such as snakeviz, as well as being summarised by a ProfileReport
+class WorkerProfiler:
+    SUFFIX = ".prof"
+
+    def __init__(self, results_path, worker_index):
+        self._file_path = self.get_file_path(results_path, worker_index)
+        self._profile = cProfile.Profile()
+
+    @classmethod
+    def get_file_path(cls, results_path, worker_index):
+        return Path(results_path).with_suffix(f".worker{worker_index}{cls.SUFFIX}")
+
+    @classmethod
+    def find_files(cls, results_path):
+        results_path = Path(results_path)
+        pattern = f"{results_path.stem}.worker*{cls.SUFFIX}"
+        return sorted(results_path.parent.glob(pattern), key=lambda path: path.stat().st_mtime)
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._profile.dump_stats(self.file_path)
+
+    @property
+    def file_path(self):
+        return self._file_path
+
+
+# Merges the profiles of all workers and summarises the functions which took the most time, followed by the time taken
+# by the functions which make up most of the work that the tools do for each attestation, whether or not they are
+# among the slowest
+class ProfileReport:
+    # No. of functions listed in the summary of the functions which took the most time
+    TOP_COUNT = 15
+
+    # Pairs of the file and name of each function always included in the summary
+    KEY_FUNCTIONS = [
+        ("request_attempt.py", "set_body"),
+        ("request_attempt.py", "perform"),
+        ("stats.py", "record_task"),
+        ("result_serializer.py", "write_tasks")
+    ]
+
+    def __init__(self, file_paths):
+        self._file_paths = list(file_paths)
+        self._stats = pstats.Stats(*[str(path) for path in self._file_paths]) if self._file_paths else None
+
+    @staticmethod
+    def _format_function(key):
+        file_name, line, function_name = key
+
+        # Built-in functions have no file
+        if file_name == "~":
+            return function_name
+
+        return f"{Path(file_name).name}:{line}({function_name})"
+
+    def _make_row(self, key):
+        calls, _, own_time, total_time, _ = self._stats.stats[key]
+
+        return {
+            "function": self._format_function(key),
+            "calls": calls,
+            "own_time": own_time,
+            "total_time": total_time,
+            "own_share": own_time / self._stats.total_tt if self._stats.total_tt else None
+        }
+
+    def get_top_functions(self):
+        keys = sorted(self._stats.stats, key=lambda key: self._stats.stats[key][2], reverse=True)
+        return [self._make_row(key) for key in keys[:self.TOP_COUNT]]
+
+    def get_key_functions(self):
+        keys = [
+            key for key in self._stats.stats
+            if (Path(key[0]).name, key[2]) in self.KEY_FUNCTIONS and key[0].endswith(f"perf_tests/{Path(key[0]).name}")
+        ]
+
+        order = {function: i for i, function in enumerate(self.KEY_FUNCTIONS)}
+        keys.sort(key=lambda key: (order[(Path(key[0]).name, key[2])], key[1]))
+        return [self._make_row(key) for key in keys]
+
+    def make_table(self, rows):
+        table = (
+            Table("<52", ">9", ">8", ">8", ">6")
+            .head("function", "calls", "own", "total", "own %")
+        )
+
+        for row in rows:
+            table = table.row(
+                row["function"][:52],
+                row["calls"],
+                OutputHelpers.format_duration(row["own_time"]),
+                OutputHelpers.format_duration(row["total_time"]),
+                f"{round(row['own_share'] * 100, 1)}%" if row["own_share"] is not None else "--"
+            )
+
+        return table
+
+    def print(self):
+        if not self._stats:
+            return
+
+        top_group = (
+            ColumnGroup()
+            .set_title(f"Functions Taking the Most Time Across {len(self._file_paths)} Workers", "^")
+            .add(OutputHelpers.center(self.make_table(self.get_top_functions()).output, 95))
+        )
+
+        print(OutputHelpers.center(top_group.get_output(), 103))
+
+        key_rows = self.get_key_functions()
+
+        if key_rows:
+            key_group = (
+                ColumnGroup()
+                .set_title("Time Spent per Attestation Step", "^")
+                .add(OutputHelpers.center(self.make_table(key_rows).output, 95))
+            )
+
+            print(OutputHelpers.center(key_group.get_output(), 103))
+
+        total_f = OutputHelpers.format_duration(self._stats.total_tt)
+        print(f"  Profiled {total_f} of execution. Coroutines are counted once each time they resume, and times")
+        print("  include the overhead of profiling itself. Profiles of each worker were saved to:")
+
+        for path in self._file_paths:
+            print(f"    {path}")
+
+        print("")
+
+    @property
+    def file_paths(self):
+        return self._file_paths.copy()